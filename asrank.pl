@@ -755,21 +755,27 @@ sub clique_link_array($$$)
     return 1;
 }
 
+# persistent clique worker (graph.clique_worker), started on first use
+my $clique_pid;
+
 sub python_clique
 {
     my $verb = ($verbose && $opt eq "clique" ? 1 : 0);
     my @ases = sort {$a <=> $b} @_;
-    my $pid;
 
     if($verb) {
 	print  "# pyth: " . join (' ', @ases) . "\n";
 	printf "#  %s\n", td_asn($_) foreach (@ases);
     }
 
-    $pid = open2(\*PY_IN, \*PY_OUT, '/usr/bin/python');
-    print PY_OUT "import graph\nx = graph.graph()\n";
-    print PY_OUT "x.add_node($_)\n" foreach (@ases);
+    if(!defined($clique_pid))
+    {
+	$clique_pid = open2(\*PY_IN, \*PY_OUT, '/usr/bin/python', '-c',
+			    'import graph; graph.clique_worker()');
+    }
 
+    # one request line of edges, "x y x y ..."
+    my @edges;
     foreach my $i (0 .. $#ases)
     {
 	my $x = $ases[$i];
@@ -778,29 +784,21 @@ sub python_clique
 	    my $y = $ases[$j];
 	    next if(clique_link_array(\@ases, $x, $y) == 0 ||
 		    clique_link_array(\@ases, $y, $x) == 0);
-	    print PY_OUT "x.add_edge($x, $y)\n";
+	    push @edges, $x, $y;
 	}
     }
+    print PY_OUT join(' ', @edges) . "\n";
 
-    print PY_OUT "S = x.find_all_cliques()\n";
-    print PY_OUT "for i in S:\n";
-    print PY_OUT "  print i\n";
-    close PY_OUT;
-
+    # one clique per line, up to an empty line
     my %cs;
     while(<PY_IN>)
     {
 	chomp;
-	if(/^set\(\[(.+)\]\)$/)
-	{
-	    my @x = split(/[\s,]+/, $1);
-	    next if($#x < 0);
-	    my $set = join(' ', sort {$a <=> $b} @x);
-	    $cs{$set} = td_sum(@x);
-	}
+	last if($_ eq "");
+	my @x = split(/ /, $_);
+	my $set = join(' ', sort {$a <=> $b} @x);
+	$cs{$set} = td_sum(@x);
     }
-    close PY_IN;
-    waitpid($pid, 0);
 
     my @cs = sort {$cs{$b} <=> $cs{$a}} keys %cs;
     foreach my $set (@cs)
@@ -812,6 +810,15 @@ sub python_clique
     return split(/ /, $cs[0]);
 }
 
+sub close_clique_worker
+{
+    return if(!defined($clique_pid));
+    close PY_OUT;
+    close PY_IN;
+    waitpid($clique_pid, 0);
+    undef $clique_pid;
+}
+
 sub infer_clique($)
 {
     my $verb = ($verbose && $opt eq "clique" ? 1 : 0);
@@ -898,6 +905,7 @@ if($opt eq "clique")
 {
     read_paths();
     my @c = infer_clique(10);
+    close_clique_worker();
     print "# inferred clique: " . join(' ', sort {$a <=> $b} @c) . "\n";
     exit 0;
 }
@@ -927,6 +935,7 @@ elsif(!$filtered_flag)
 {
     read_paths();
     my @c = infer_clique(10);
+    close_clique_worker();
     $clique{$_} = 1 foreach(@c);
     print "# inferred clique: " . join(' ', sort {$a <=> $b} @c) . "\n";
     if(scalar(keys %ixp) > 0)
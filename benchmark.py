@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import math
+import argparse
+import subprocess
+import profiling
+import synthetic
+from bgp_path_parser import BgpPaths
+from link import Links
+from feature import ProblinkFeatures
+from peeringdb import PeeringDB
+from problink import naive_bayes_batched
+
+DEFAULT_SIZES = '10000,100000,1000000,10000000'
+
+
+def run_stages(directory, compact=False, columnar=False):
+    """Run the ProbLink stages on the synthetic inputs in directory and return the profiling report.
+
+    Times parse_bgp_paths, ingest_prob, each attribute builder (nested in
+    construct_attributes), compute_feature_likelihoods and scoring, which
+    writes problink_result.txt to directory.
+    """
+    os.chdir(directory)
+    profiler = profiling.enable()
+    peeringdb = PeeringDB('peeringdb.json')
+    with profiling.stage('parse_bgp_paths') as counts:
+        path = BgpPaths(compact)
+        path.extract_ixp(peeringdb)
+        path.parse_bgp_paths('rib.txt')
+        counts.update(paths=len(path))
+    links = Links(path)
+    with profiling.stage('ingest_prob') as counts:
+        links.ingest_prob('asrank_result.txt', columnar)
+        counts.update(links=len(links.prob))
+    with profiling.stage('construct_attributes'):
+        links.construct_attributes('as-org.txt', peeringdb)
+    with profiling.stage('compute_feature_likelihoods'):
+        features = ProblinkFeatures(links)
+        features.compute_feature_likelihoods()
+    with profiling.stage('naive_bayes') as counts:
+        naive_bayes_batched(links, features)
+        counts.update(links=len(links.prob))
+    return profiler.report()
+
+
+def scaling_curves(sizes, reports):
+    """Per-stage series over the benchmark sizes, and the log-log slope of wall time
+    against the number of paths between the smallest and largest size (1 is linear)."""
+    curves = {}
+    for size, report in zip(sizes, reports):
+        for record in report['stages']:
+            curve = curves.setdefault(record['stage'], {'paths': [], 'wall_s': [], 'cpu_s': [],
+                                                        'peak_rss_mb': [], 'peak_rss_delta_mb': []})
+            curve['paths'].append(size)
+            for key in ('wall_s', 'cpu_s', 'peak_rss_mb', 'peak_rss_delta_mb'):
+                curve[key].append(record[key])
+    for curve in curves.itervalues():
+        paths, wall = curve['paths'], curve['wall_s']
+        if len(paths) > 1 and wall[0] > 0 and wall[-1] > 0:
+            curve['exponent'] = math.log(wall[-1] / wall[0]) / math.log(float(paths[-1]) / paths[0])
+        else:
+            curve['exponent'] = None
+    return curves
+
+
+def print_table(sizes, reports):
+    print('%-32s' % 'stage' + ''.join('%22s' % ('%d paths' % size) for size in sizes))
+    for i, record in enumerate(reports[0]['stages']):
+        name = record['stage'] if record['parent'] is None else '  ' + record['stage']
+        cells = []
+        for report in reports:
+            record = report['stages'][i]
+            cells.append('%22s' % ('%.2fs %+.0fMB' % (record['wall_s'], record['peak_rss_delta_mb'])))
+        print('%-32s' % name + ''.join(cells))
+    print('%-32s' % 'peak RSS' + ''.join('%22s' % ('%.0fMB' % report['peak_rss_mb']) for report in reports))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark ProbLink stages on synthetic AS topologies of growing size')
+    parser.add_argument('-n', '--sizes',
+                        help='Comma-separated numbers of BGP paths to benchmark',
+                        default=DEFAULT_SIZES)
+    parser.add_argument('-d', '--data_dir',
+                        help='Directory for the synthetic inputs, one subdirectory per size; '
+                             'inputs already there are reused',
+                        default='benchmark_data')
+    parser.add_argument('-o', '--output',
+                        help='JSON file for the reports and scaling curves',
+                        default='benchmark.json')
+    parser.add_argument('--seed',
+                        help='Random seed of the synthetic topologies',
+                        type=int, default=1)
+    parser.add_argument('-c', '--compact',
+                        help='Store BGP paths in a compact integer-encoded form',
+                        action='store_true')
+    parser.add_argument('--columnar',
+                        help='Keep per-link attributes in typed columns of a LinkTable',
+                        action='store_true')
+    parser.add_argument('--run',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        # one size, in a fresh process so that peak RSS is its own
+        report = run_stages(args.run, args.compact, args.columnar)
+        with open('report.json', 'w') as f:
+            json.dump(report, f)
+        sys.exit(0)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    reports = []
+    for size in sizes:
+        directory = os.path.abspath(os.path.join(args.data_dir, str(size)))
+        if not os.path.exists(os.path.join(directory, 'rib.txt')):
+            print('Generating %d synthetic paths...' % size)
+            synthetic.generate(directory, size, args.seed)
+        print('Benchmarking %d paths...' % size)
+        command = [sys.executable, os.path.abspath(__file__), '--run', directory]
+        command += ['--compact'] * args.compact + ['--columnar'] * args.columnar
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(command, stdout=devnull)
+        with open(os.path.join(directory, 'report.json')) as f:
+            reports.append(json.load(f))
+    print_table(sizes, reports)
+    with open(args.output, 'w') as f:
+        json.dump({'sizes': sizes, 'reports': reports, 'curves': scaling_curves(sizes, reports)},
+                  f, indent=2, sort_keys=True)
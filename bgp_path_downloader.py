@@ -1,11 +1,34 @@
 #!/usr/bin/env python
+import os
 import datetime
 import argparse
+from multiprocessing import Pool
+from dedup import ExternalDedup
 from _pybgpstream import BGPStream, BGPRecord
 
 
-def downloader(start_date, duration):
-    """Download BGP paths from Routeviews and RIPE NCC from a start date for a certain duration."""
+def record_paths(rec):
+    """Yield the AS paths of a valid BGPStream record that are towards IPv4 prefixes
+    and contain no AS sets or confederations."""
+    elem = rec.get_next_elem()
+    while(elem):
+        path = elem.fields['as-path']
+        if '{' in path or '(' in path:
+            elem = rec.get_next_elem()
+            continue
+        prefix = elem.fields['prefix']
+        # Focus on IPv4 prefixes
+        if ":" not in prefix:
+            yield path
+        elem = rec.get_next_elem()
+
+
+def downloader(start_date, duration, memory_budget=None):
+    """Download BGP paths from Routeviews and RIPE NCC from a start date for a certain duration.
+
+    With a memory_budget (in bytes) paths are deduplicated through an
+    ExternalDedup and written once the stream ends.
+    """
 
     # Start of UNIX time
     base = int(datetime.datetime.strptime(start_date, '%m/%d/%Y').strftime('%s'))
@@ -14,37 +37,131 @@ def downloader(start_date, duration):
     stream.add_interval_filter(base, base + int(duration))
     stream.add_filter('record-type', 'ribs')
     stream.start()
+    if memory_budget is not None:
+        dedup = ExternalDedup(memory_budget)
+        try:
+            while True:
+                rec = stream.get_next_record()
+                if rec is None:
+                    break
+                if rec.status == "valid":
+                    dedup.update(record_paths(rec))
+            write_paths(dedup)
+        finally:
+            dedup.close()
+        return
     path_set = set()
     f = open('rib.txt', 'w')
     while True:
         rec = stream.get_next_record()
         if rec is None:
-            return
+            break
         if rec.status != "valid":
             continue
         else:
-            elem = rec.get_next_elem()
-            while(elem):
-                path = elem.fields['as-path']
-                if '{' in path or '(' in path:
-                    elem = rec.get_next_elem()
-                    continue
-                prefix = elem.fields['prefix']
-                # Focus on IPv4 prefixes
-                if ":" not in prefix and path not in path_set:
+            for path in record_paths(rec):
+                if path not in path_set:
                     f.write(path.replace(' ', '|') + '\n')
                     path_set.add(path)
-                elem = rec.get_next_elem()
     f.close()
 
 
+def write_paths(paths):
+    """Write unique space-separated AS paths to rib.txt."""
+    with open('rib.txt', 'w') as f:
+        for path in paths:
+            f.write(path.replace(' ', '|') + '\n')
+
+
+def collector_paths(mrt_files):
+    """Read the RIB dumps of one collector from local MRT files and return its unique AS paths."""
+    path_set = set()
+    for mrt_file in mrt_files:
+        stream = BGPStream()
+        stream.set_data_interface('singlefile')
+        stream.set_data_interface_option('singlefile', 'rib-file', mrt_file)
+        stream.start()
+        while True:
+            rec = stream.get_next_record()
+            if rec is None:
+                break
+            if rec.status == "valid":
+                path_set.update(record_paths(rec))
+    return path_set
+
+
+def mrt_collectors(mrt_dir):
+    """Group the MRT files under a directory by collector.
+
+    Every subdirectory is taken to hold the dumps of one collector;
+    MRT files directly inside mrt_dir are each treated as their own collector.
+    """
+    collectors = []
+    for name in sorted(os.listdir(mrt_dir)):
+        path = os.path.join(mrt_dir, name)
+        if os.path.isdir(path):
+            files = []
+            for root, dirs, filenames in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, i) for i in sorted(filenames))
+            if files:
+                collectors.append(files)
+        else:
+            collectors.append([path])
+    return collectors
+
+
+def mrt_ingest(mrt_dir, workers=1, memory_budget=None):
+    """Extract BGP paths from a local mirror of MRT RIB dumps, one collector per worker process.
+
+    With a memory_budget (in bytes) the merged paths are deduplicated through
+    an ExternalDedup instead of an in-memory set.
+    """
+    pool = Pool(workers)
+    if memory_budget is not None:
+        dedup = ExternalDedup(memory_budget)
+        try:
+            for collector_set in pool.imap_unordered(collector_paths, mrt_collectors(mrt_dir)):
+                dedup.update(collector_set)
+            write_paths(dedup)
+        finally:
+            pool.close()
+            pool.join()
+            dedup.close()
+        return
+    path_set = set()
+    f = open('rib.txt', 'w')
+    try:
+        for collector_set in pool.imap_unordered(collector_paths, mrt_collectors(mrt_dir)):
+            for path in collector_set:
+                if path not in path_set:
+                    f.write(path.replace(' ', '|') + '\n')
+                    path_set.add(path)
+    finally:
+        pool.close()
+        pool.join()
+        f.close()
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Download BGP paths from a start date for a duration')
     parser.add_argument('-s', '--start',
-                        help='The start date',
-                        required=True)
+                        help='The start date')
     parser.add_argument('-d', '--duration',
-                        help='Duration in minutes',
-                        required=True)
+                        help='Duration in minutes')
+    parser.add_argument('-m', '--mrt_dir',
+                        help='Read local MRT RIB dumps (one subdirectory per collector) instead of BGPStream')
+    parser.add_argument('-w', '--workers',
+                        help='Number of collectors read in parallel with --mrt_dir',
+                        type=int, default=1)
+    parser.add_argument('-b', '--memory_budget',
+                        help='Deduplicate paths within this many MB, spilling sorted runs to disk',
+                        type=float)
     args = parser.parse_args()
-    downloader(args.start, args.duration)
+    memory_budget = int(args.memory_budget * 2**20) if args.memory_budget else None
+    if args.mrt_dir:
+        mrt_ingest(args.mrt_dir, args.workers, memory_budget)
+    elif args.start and args.duration:
+        downloader(args.start, args.duration, memory_budget)
+    else:
+        parser.error('either --mrt_dir or both --start and --duration are required')
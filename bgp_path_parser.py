@@ -1,35 +1,31 @@
-import sys
-import json
-import sqlite3
+import os
+import hashlib
+import struct
+import argparse
+from multiprocessing import Pool
+from collections import deque
+from path_store import PathStore
+from dedup import ExternalDedup
+from fileio import open_input, is_compressed
+from peeringdb import load_peeringdb
 
 
 class BgpPaths(object):
-    """ Class for storing and sanitizing forward and reverse BGP paths """
+    """ Class for storing and sanitizing forward and reverse BGP paths
 
-    def __init__(self):
+    With compact=True paths are kept in an integer-encoded PathStore instead
+    of the forward_paths/reverse_paths string sets.
+    """
+
+    def __init__(self, compact=False):
         self.forward_paths = set()
         self.reverse_paths = set()
         self.ixp = set()
+        self.path_store = PathStore() if compact else None
 
-    def extract_ixp(self, peeringdb_file):
-        # PeeringDB json dump
-        if peeringdb_file.endswith('json'):
-            with open(peeringdb_file) as f:
-                data = json.load(f)
-            for i in data['net']['data']:
-                if i['info_type'] == 'Route Server':
-                    self.ixp.add(str(i['asn']))
-
-        # PeeringDB sqlite dump
-        elif peeringdb_file.endswith('sqlite'):
-            conn = sqlite3.connect(peeringdb_file)
-            c = conn.cursor()
-            for row in c.execute("SELECT asn, info_type FROM 'peeringdb_network'"):
-                asn, info_type = row
-                if info_type == 'Route Server':
-                    self.ixp.add(str(asn))
-        else:
-            raise TypeError('PeeringDB file must be either a json file or a sqlite file.')
+    def extract_ixp(self, peeringdb):
+        """ Collect route server ASes from a PeeringDB object or a PeeringDB file name. """
+        self.ixp.update(load_peeringdb(peeringdb).route_servers)
 
         # Use IXP ASNs collected by https://github.com/vgiotsas/IxpRsCollector
         # if no route servers were included in the peeringdb file
@@ -39,57 +35,310 @@ class BgpPaths(object):
         #             if not line.startswith('#'):
         #                 self.ixp.add(line.strip())
 
-    def parse_bgp_paths(self, rib_file):
+    def parse_bgp_paths(self, rib_file, workers=1, memory_budget=None):
         """ Parse BGP paths from a RIB file.
 
         Remove duplicated ASes, an artifact of BGP path prepending.
         Sanitize the BGP paths: remove route server ASes;
                                 remove paths containing reserved ASes;
                                 remove paths with AS loops.
+
+        With workers > 1 the file is split into byte-range chunks that are
+        sanitized in a process pool, and the per-chunk path sets are merged.
+        Compressed RIB files (.gz, .bz2, .xz) are decompressed as a stream,
+        and in parallel mode their lines are handed to the pool in batches.
+        With a memory_budget (in bytes) sanitized paths are deduplicated
+        through an ExternalDedup that spills to disk, and streamed from there
+        into a PathStore, which this object then keeps its paths in (as with
+        compact=True): the string sets would hold every path in memory again.
+        The budget bounds the deduplication; the stored paths come on top.
+        Worker processes are then handed batches of lines, a few per worker
+        at a time, so that parsed chunks do not pile up in memory either.
+        """
+        if memory_budget is None:
+            for forward_paths, reverse_paths in self._sanitized_path_sets(rib_file, workers):
+                if self.path_store is not None:
+                    for path in forward_paths:
+                        self.path_store.add(path.split("|"))
+                else:
+                    self.forward_paths.update(forward_paths)
+                    self.reverse_paths.update(reverse_paths)
+        else:
+            if self.path_store is None:
+                self.path_store = PathStore()
+            dedup = ExternalDedup(memory_budget)
+            try:
+                for forward_paths, reverse_paths in self._sanitized_path_sets(rib_file, workers, batched=True):
+                    dedup.update(forward_paths)
+                for path in dedup:
+                    self.path_store.add(path.split("|"))
+            finally:
+                dedup.close()
+        if self.path_store is not None:
+            self.path_store.freeze()
+
+    def write_sanitized_paths(self, rib_file, out_file, workers=1, memory_budget=None):
+        """ Sanitize a RIB file and write the unique paths straight to out_file.
+
+        Paths are deduplicated through an ExternalDedup, so memory stays within
+        memory_budget bytes; this object's path sets are left untouched.
+        """
+        dedup = ExternalDedup(memory_budget if memory_budget is not None else float('inf'))
+        try:
+            for forward_paths, reverse_paths in self._sanitized_path_sets(rib_file, workers,
+                                                                          batched=memory_budget is not None):
+                dedup.update(forward_paths)
+            with open(out_file, 'w') as f:
+                for path in dedup:
+                    f.write(path + '\n')
+        finally:
+            dedup.close()
+
+    def _sanitized_path_sets(self, rib_file, workers, batched=False):
+        """ Yield (forward paths, reverse paths) sets for successive parts of a RIB file.
+
+        In parallel, uncompressed files are split into a few byte-range chunks
+        per worker, unless batched is set; compressed files, and batched
+        parsing, hand the workers batches of lines, at most two per worker at
+        a time.
         """
-        with open(rib_file) as f:
-            for line in f:
-                asn_list = line.strip().split("|")
-                # remove IXPs
-                for asn in asn_list:
-                    if asn in self.ixp:
-                        asn_list.remove(asn)
-                # remove prepended ASes
-                asn_list = [v for i, v in enumerate(asn_list)
-                            if i == 0 or v != asn_list[i-1]]
-                asn_set = set(asn_list)
-                # remove poisoned paths with AS loops
-                if len(asn_set) == 1 or not len(asn_list) == len(asn_set):
-                    continue
+        if workers > 1:
+            pool = Pool(workers, initializer=_init_worker, initargs=(self.ixp,))
+            f = None
+            try:
+                if batched or is_compressed(rib_file):
+                    f = open_input(rib_file)
+                    results = _imap_bounded(pool, _parse_lines, _batch_lines(f), 2 * workers)
                 else:
-                    for asn in asn_list:
-                        asn = int(asn)
-                        # reserved ASN
-                        if asn == 0 or asn == 23456 or asn >= 394240 \
-                           or (61440 <= asn <= 131071) \
-                           or (133120 <= asn <= 196607)\
-                           or (199680 <= asn <= 262143)\
-                           or (263168 <= asn <= 327679)\
-                           or (328704 <= asn <= 393215):
-                            break
-                    else:
-                        self.forward_paths.add("|".join(asn_list))
-                        self.reverse_paths.add("|".join(asn_list[::-1]))
-                    continue
+                    chunks = [(rib_file, start, end) for start, end in chunk_offsets(rib_file, workers * 4)]
+                    results = pool.imap_unordered(_parse_chunk, chunks)
+                for path_sets in results:
+                    yield path_sets
+            finally:
+                if f is not None:
+                    f.close()
+                pool.close()
+                pool.join()
+        else:
+            with open_input(rib_file) as f:
+                for lines in _batch_lines(f):
+                    yield sanitize_lines(lines, self.ixp)
+
+    def __len__(self):
+        """ Number of forward paths. """
+        if self.path_store is not None:
+            return len(self.path_store)
+        return len(self.forward_paths)
+
+    def iter_forward_paths(self):
+        """ Yield every forward path as a list of ASes. """
+        if self.path_store is not None:
+            return self.path_store.iter_forward()
+        return (path.split("|") for path in self.forward_paths)
+
+    def iter_paths_with_reverse(self):
+        """ Yield (forward path, reverse_new) pairs, where reverse_new tells whether the
+        reverse of the path is not itself a forward path, i.e. whether walking it
+        as well visits each path of the forward/reverse union exactly once. """
+        if self.path_store is not None:
+            for item in self.path_store.iter_with_reverse():
+                yield item
+        else:
+            for path in self.forward_paths:
+                ASes = path.split("|")
+                yield ASes, "|".join(ASes[::-1]) not in self.forward_paths
+
+    def iter_all_paths(self):
+        """ Yield the union of forward and reverse paths as lists of ASes. """
+        if self.path_store is not None:
+            return self.path_store.iter_union()
+        return (path.split("|") for path in (self.forward_paths | self.reverse_paths))
+
+    def save_cache(self, cache_file, key):
+        """ Write the sanitized paths and IXP set to a memory-mappable cache file. """
+        store = self.path_store
+        if store is None:
+            store = PathStore()
+            for path in self.forward_paths:
+                store.add(path.split("|"))
+        store.save(cache_file, {'key': key, 'ixp': sorted(self.ixp)})
+
+    def load_cache(self, cache_file, key):
+        """ Memory-map the paths and IXP set of a cache file written for the same key.
+
+        Returns False, leaving this object untouched, if the cache is missing, stale,
+        truncated or otherwise unreadable, so that the paths are parsed again.
+        """
+        if not os.path.exists(cache_file):
+            return False
+        try:
+            store, header = PathStore.load(cache_file)
+        except (ValueError, KeyError, struct.error, EnvironmentError):
+            return False
+        if header.get('key') != key:
+            return False
+        self.path_store = store
+        self.ixp = set(str(asn) for asn in header['ixp'])
+        return True
 
     def output_forward_paths(self):
         f = open('sanitized_rib.txt', 'w')
-        for path in self.forward_paths:
-            f.write(path + '\n')
+        if self.path_store is not None:
+            for asn_list in self.path_store.iter_forward():
+                f.write("|".join(asn_list) + '\n')
+        else:
+            for path in self.forward_paths:
+                f.write(path + '\n')
         f.close()
 
 
+def sanitize_path(line, ixp):
+    """ Sanitize one RIB line, returning its list of ASes or None if the path is dropped. """
+    asn_list = line.strip().split("|")
+    # remove IXPs
+    for asn in asn_list:
+        if asn in ixp:
+            asn_list.remove(asn)
+    # remove prepended ASes
+    asn_list = [v for i, v in enumerate(asn_list)
+                if i == 0 or v != asn_list[i-1]]
+    asn_set = set(asn_list)
+    # remove poisoned paths with AS loops
+    if len(asn_set) == 1 or not len(asn_list) == len(asn_set):
+        return None
+    for asn in asn_list:
+        if reserved_asn(int(asn)):
+            return None
+    return asn_list
+
+
+def reserved_asn(asn):
+    """ Whether an ASN, given as a number, is reserved or unallocated, which drops the paths it is on. """
+    return asn == 0 or asn == 23456 or asn >= 394240 \
+        or (61440 <= asn <= 131071) \
+        or (133120 <= asn <= 196607)\
+        or (199680 <= asn <= 262143)\
+        or (263168 <= asn <= 327679)\
+        or (328704 <= asn <= 393215)
+
+
+def sanitize_lines(lines, ixp):
+    """ Sanitize RIB lines into sets of unique forward and reverse paths. """
+    forward_paths, reverse_paths = set(), set()
+    for line in lines:
+        asn_list = sanitize_path(line, ixp)
+        if asn_list is not None:
+            forward_paths.add("|".join(asn_list))
+            reverse_paths.add("|".join(asn_list[::-1]))
+    return forward_paths, reverse_paths
+
+
+def fingerprint(*filenames):
+    """ SHA-1 over the contents of the given files, used to key cached results. """
+    h = hashlib.sha1()
+    for filename in filenames:
+        h.update(os.path.basename(filename).encode('utf-8'))
+        with open(filename, 'rb') as f:
+            block = f.read(1 << 20)
+            while block:
+                h.update(block)
+                block = f.read(1 << 20)
+    return h.hexdigest()
+
+
+def chunk_offsets(rib_file, n_chunks):
+    """ Split a file into at most n_chunks (start, end) byte ranges aligned to line starts. """
+    size = os.path.getsize(rib_file)
+    offsets = [0]
+    with open(rib_file) as f:
+        for i in range(1, n_chunks):
+            pos = size * i // n_chunks
+            if pos <= offsets[-1]:
+                continue
+            f.seek(pos - 1)
+            # move to the start of the next line
+            f.readline()
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > offsets[-1]:
+                offsets.append(pos)
+    offsets.append(size)
+    return zip(offsets[:-1], offsets[1:])
+
+
+_worker_ixp = set()
+
+
+def _init_worker(ixp):
+    global _worker_ixp
+    _worker_ixp = ixp
+
+
+def _parse_chunk(args):
+    """ Sanitize the lines of one byte range of a RIB file in a worker process. """
+    rib_file, start, end = args
+    with open(rib_file) as f:
+        f.seek(start)
+        return sanitize_lines(_read_until(f, start, end), _worker_ixp)
+
+
+def _read_until(f, pos, end):
+    while pos < end:
+        line = f.readline()
+        if not line:
+            break
+        pos += len(line)
+        yield line
+
+
+def _batch_lines(f, batch_size=20000):
+    batch = []
+    for line in f:
+        batch.append(line)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _imap_bounded(pool, func, items, window):
+    """ pool.imap of func over items with at most window items in flight: imap
+    itself reads ahead through all of items, however large the input. """
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _parse_lines(lines):
+    """ Sanitize a batch of RIB lines in a worker process. """
+    return sanitize_lines(lines, _worker_ixp)
+
+
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print('Usage: python bgp_path_parser.py <peeringdb file>')
-        exit()
+    parser = argparse.ArgumentParser(description='Sanitize BGP paths of a RIB file')
+    parser.add_argument('peeringdb',
+                        help='PeeringDB file')
+    parser.add_argument('-r', '--rib',
+                        help='RIB file of BGP paths, optionally compressed (.gz, .bz2, .xz)',
+                        default='rib.txt')
+    parser.add_argument('-w', '--workers',
+                        help='Number of parser processes',
+                        type=int, default=1)
+    parser.add_argument('-b', '--memory_budget',
+                        help='Deduplicate paths within this many MB, spilling sorted runs to disk',
+                        type=float)
+    args = parser.parse_args()
 
     path = BgpPaths()
-    path.extract_ixp(sys.argv[1])
-    path.parse_bgp_paths('rib.txt')
-    path.output_forward_paths()
+    path.extract_ixp(args.peeringdb)
+    if args.memory_budget:
+        path.write_sanitized_paths(args.rib, 'sanitized_rib.txt', args.workers, int(args.memory_budget * 2**20))
+    else:
+        path.parse_bgp_paths(args.rib, args.workers)
+        path.output_forward_paths()
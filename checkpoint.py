@@ -0,0 +1,43 @@
+import os
+import cPickle as pickle
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoints(object):
+    """Per-stage checkpoints of a problink run, one binary pickle file per stage in directory.
+
+    A checkpoint is only loaded if it was written for the same key, a
+    fingerprint of the input files and options, and can be read in full;
+    anything else counts as missing, so the stage runs again. Loading is
+    only done with resume, while saving always is.
+    """
+    def __init__(self, directory, key, resume=False):
+        self.directory = directory
+        self.key = key
+        self.resume = resume
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _file(self, stage):
+        return os.path.join(self.directory, stage + '.ckpt')
+
+    def load(self, stage):
+        """Return the data checkpointed for a stage, or None if there is no valid checkpoint."""
+        if not self.resume or not os.path.exists(self._file(stage)):
+            return None
+        try:
+            with open(self._file(stage), 'rb') as f:
+                version, key, data = pickle.load(f)
+        except Exception:
+            return None
+        if version != CHECKPOINT_VERSION or key != self.key:
+            return None
+        return data
+
+    def save(self, stage, data):
+        """Checkpoint the data of a stage; the file is replaced atomically."""
+        tmp_file = self._file(stage) + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump((CHECKPOINT_VERSION, self.key, data), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, self._file(stage))
@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class CSRGraph(object):
+    """Undirected, unweighted graph with integer node ids and CSR adjacency.
+
+    The neighbors of node i are indices[indptr[i]:indptr[i+1]];
+    node_id maps a node label (e.g. an ASN) to its id, nodes maps back.
+    """
+    def __init__(self, edges):
+        self.node_id = {}
+        self.nodes = []
+        src, dst = [], []
+        for u, v in edges:
+            for node in (u, v):
+                if node not in self.node_id:
+                    self.node_id[node] = len(self.nodes)
+                    self.nodes.append(node)
+            # self-loops add the node but no edge
+            if u == v:
+                continue
+            src.append(self.node_id[u])
+            dst.append(self.node_id[v])
+        n = len(self.nodes)
+        src = np.array(src, dtype=np.int64)
+        dst = np.array(dst, dtype=np.int64)
+        # store both directions once, dropping parallel edges
+        keys = np.unique(np.concatenate((src * n + dst, dst * n + src)))
+        self.indices = (keys % n).astype(np.int32) if n else np.zeros(0, dtype=np.int32)
+        heads = keys // n if n else keys
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=n), out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.node_id
+
+    def multi_source_bfs(self, sources):
+        """Breadth-first search from every source node at once.
+
+        Returns an int32 array of shape (len(sources), number of nodes) with the
+        hop distance from each source to each node, or -1 if unreachable.
+        Each level expands the frontiers of all sources in one vectorized step.
+        """
+        n = len(self.nodes)
+        dist = np.full((len(sources), n), -1, dtype=np.int32)
+        rows = np.arange(len(sources), dtype=np.int64)
+        frontier = np.array([self.node_id[s] for s in sources], dtype=np.int64)
+        dist[rows, frontier] = 0
+        level = 0
+        while len(frontier):
+            level += 1
+            degree = self.indptr[frontier + 1] - self.indptr[frontier]
+            total = degree.sum()
+            if total == 0:
+                break
+            # position of every outgoing edge of the frontier in self.indices
+            edge = np.repeat(self.indptr[frontier] - (np.cumsum(degree) - degree), degree) + np.arange(total)
+            rows = np.repeat(rows, degree)
+            neighbors = self.indices[edge].astype(np.int64)
+            unseen = dist[rows, neighbors] == -1
+            keys = np.unique(rows[unseen] * n + neighbors[unseen])
+            rows, frontier = keys // n, keys % n
+            dist[rows, frontier] = level
+        return dist
@@ -0,0 +1,68 @@
+import os
+import heapq
+import tempfile
+
+# rough per-entry cost of a str in a set, on top of its characters
+ENTRY_OVERHEAD = 100
+
+
+class ExternalDedup(object):
+    """Deduplicate newline-free strings within a memory budget.
+
+    Strings are collected in a set until its estimated size exceeds
+    memory_budget bytes, then the set is written to disk as a sorted run.
+    Iterating merges the runs and yields every distinct string once, giving
+    the same unique set as an unbounded in-memory set.
+    """
+    def __init__(self, memory_budget, tmp_dir=None):
+        self.memory_budget = memory_budget
+        self.tmp_dir = tmp_dir
+        self._buffer = set()
+        self._size = 0
+        self._runs = []
+
+    def add(self, item):
+        if item not in self._buffer:
+            self._buffer.add(item)
+            self._size += len(item) + ENTRY_OVERHEAD
+            if self._size > self.memory_budget:
+                self._spill()
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def _spill(self):
+        fd, run_file = tempfile.mkstemp(prefix='dedup-run-', dir=self.tmp_dir)
+        with os.fdopen(fd, 'w') as f:
+            for item in sorted(self._buffer):
+                f.write(item + '\n')
+        self._runs.append(run_file)
+        self._buffer = set()
+        self._size = 0
+
+    def __iter__(self):
+        if not self._runs:
+            for item in self._buffer:
+                yield item
+            return
+        if self._buffer:
+            self._spill()
+        files = [open(run_file) for run_file in self._runs]
+        try:
+            last = None
+            for line in heapq.merge(*files):
+                if line != last:
+                    yield line[:-1]
+                    last = line
+        finally:
+            for f in files:
+                f.close()
+
+    def close(self):
+        """Remove the spilled runs."""
+        for run_file in self._runs:
+            os.remove(run_file)
+        self._runs = []
+        self._buffer = set()
+        self._size = 0
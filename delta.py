@@ -0,0 +1,311 @@
+import os
+import json
+import shutil
+import numpy as np
+from bgp_path_parser import BgpPaths, fingerprint, sanitize_path
+from fileio import open_input
+from link import Links, LINK_COLUMNS
+from link_table import LinkTable, LinkColumn, PairCounts
+from model import ProblinkModel
+from path_store import PathStore, path_hash, path_hashes
+
+STATE_VERSION = 2
+# files of the base paths of a SavedPaths, hard-linked from state to state
+PATH_FILES = ('paths.store', 'paths.hash.npy', 'paths.order.npy', 'paths.extra.npy')
+# paths removed and added since the base, as a fraction of it, past which save_state writes a new base
+REBASE_FRACTION = 0.25
+
+
+def state_key(bootstrap_rel_file, peeringdb_file, asn_org_file):
+    """Fingerprint of the inputs a saved state is only valid for."""
+    return fingerprint(bootstrap_rel_file, peeringdb_file, asn_org_file)
+
+
+class SavedPaths(object):
+    """The forward paths of a saved state, as '|'-joined strings, and the extra lines
+    (see count_extra_lines) behind each.
+
+    A base PathStore, with the sorted hashes of its paths, answers lookups;
+    the paths removed from it and added to it since, and the extra line
+    counts set since, are kept on the side. A delta only touches the paths it
+    changes, and the base of a loaded state stays memory-mapped.
+    """
+    def __init__(self, store, hashes, order, extra_lines, directory=None):
+        self.store = store
+        # plain views of the memory-mapped arrays, which index faster one item at a time
+        self.offsets, self.asn_ids = np.asarray(store.offsets), np.asarray(store.asn_ids)
+        self.hashes = hashes
+        # base path number of each hash
+        self.order = order
+        self.base_extra_lines = extra_lines
+        # the state directory the base files are in, None while they are only in memory
+        self.directory = directory
+        self.removed = set()
+        self.added = set()
+        self.extra = {}
+
+    @classmethod
+    def from_store(cls, store, extra_lines):
+        """SavedPaths of the paths of a PathStore, extra_lines mapping paths to their extra lines."""
+        store.freeze()
+        hashes = path_hashes(store.offsets, store.asn_ids)
+        order = np.argsort(hashes, kind='mergesort')
+        paths = cls(store, hashes[order], order, np.zeros(len(store), dtype=np.uint32))
+        for path, n in extra_lines.iteritems():
+            i = paths._find(path)
+            if i >= 0:
+                paths.base_extra_lines[i] = n
+        return paths
+
+    @classmethod
+    def from_paths(cls, bgp_paths, extra_lines):
+        """SavedPaths of the forward paths of a BgpPaths."""
+        store = bgp_paths.path_store
+        if store is None:
+            store = PathStore()
+            for ASes in bgp_paths.iter_forward_paths():
+                store.add(ASes)
+        return cls.from_store(store, extra_lines)
+
+    @classmethod
+    def load(cls, directory, changes):
+        """Memory-map the base paths of a state directory and apply changes, as saved by save()."""
+        store, header = PathStore.load(os.path.join(directory, 'paths.store'))
+        paths = cls(store, _load_array(directory, 'paths.hash'), _load_array(directory, 'paths.order'),
+                    _load_array(directory, 'paths.extra'), directory)
+        paths.removed = set(changes['removed'])
+        paths.added = set(str(path) for path in changes['added'])
+        paths.extra = dict((str(path), n) for path, n in changes['extra_lines'].iteritems())
+        return paths
+
+    def _find(self, path):
+        """Number of a path in the base store, or -1."""
+        ids = []
+        for asn in path.split("|"):
+            i = self.store.asn_id.get(asn)
+            if i is None:
+                return -1
+            ids.append(i)
+        h = np.uint64(path_hash(ids))
+        position = int(np.searchsorted(self.hashes, h))
+        while position < len(self.hashes) and self.hashes[position] == h:
+            i = int(self.order[position])
+            if self.asn_ids[self.offsets[i]:self.offsets[i+1]].tolist() == ids:
+                return i
+            position += 1
+        return -1
+
+    def __contains__(self, path):
+        if path in self.added:
+            return True
+        i = self._find(path)
+        return i >= 0 and i not in self.removed
+
+    def __len__(self):
+        return len(self.store) - len(self.removed) + len(self.added)
+
+    def add(self, path):
+        i = self._find(path)
+        if i >= 0:
+            self.removed.discard(i)
+        else:
+            self.added.add(path)
+
+    def remove(self, path):
+        if path in self.added:
+            self.added.remove(path)
+        else:
+            self.removed.add(self._find(path))
+
+    def extra_lines(self, path):
+        if path in self.extra:
+            return self.extra[path]
+        i = self._find(path)
+        return int(self.base_extra_lines[i]) if i >= 0 else 0
+
+    def set_extra_lines(self, path, n):
+        self.extra[path] = n
+
+    def _rebase(self):
+        """Make the current paths the base, in memory."""
+        store = PathStore()
+        extra_lines = {}
+        for i, ASes in enumerate(self.store.iter_forward()):
+            if i not in self.removed:
+                store.add(ASes)
+                if self.base_extra_lines[i]:
+                    extra_lines["|".join(ASes)] = int(self.base_extra_lines[i])
+        for path in self.added:
+            store.add(path.split("|"))
+        extra_lines.update((path, n) for path, n in self.extra.iteritems() if path in self)
+        self.__dict__.update(SavedPaths.from_store(store, extra_lines).__dict__)
+
+    def save(self, directory):
+        """Write the paths to a new state directory and return their changes since the
+        base, for load().
+
+        The base files are hard-linked from the state directory they were
+        loaded from, until the changes outgrow REBASE_FRACTION of the base
+        and a new base is written.
+        """
+        if self.directory is None or len(self.removed) + len(self.added) > REBASE_FRACTION * len(self.store):
+            self._rebase()
+            self.store.save(os.path.join(directory, 'paths.store'))
+            for name, arr in (('paths.hash', self.hashes), ('paths.order', self.order),
+                              ('paths.extra', self.base_extra_lines)):
+                np.save(os.path.join(directory, name + '.npy'), arr)
+        else:
+            for name in PATH_FILES:
+                os.link(os.path.join(self.directory, name), os.path.join(directory, name))
+        # extra lines of base paths are kept while they are removed, as the base still has them
+        extra_lines = dict((path, n) for path, n in self.extra.iteritems()
+                           if path in self.added or self._find(path) >= 0)
+        return {'removed': sorted(self.removed), 'added': sorted(self.added), 'extra_lines': extra_lines}
+
+
+def _load_array(directory, name, mode='r'):
+    """Memory-map an array saved by save_state; mode 'c' for arrays a delta updates."""
+    filename = os.path.join(directory, name + '.npy')
+    try:
+        # a plain view of the memory map, which indexes faster one item at a time
+        return np.asarray(np.load(filename, mmap_mode=mode))
+    except ValueError:
+        # empty arrays cannot be memory-mapped
+        return np.load(filename)
+
+
+def save_state(state_dir, key, links, paths, model, decisions):
+    """Save what a delta run needs from this run to the directory state_dir.
+
+    links must be columnar and have been through count_path_attributes();
+    paths is the SavedPaths of its forward paths, model the ProblinkModel
+    the links were scored with and decisions an int8 LinkColumn of the
+    decide() value of every scored link. Link attributes are saved as .npy
+    arrays in LinkTable row order, the paths as in SavedPaths.save(). The
+    state is written next to state_dir and replaces it once complete.
+    """
+    tmp_dir = state_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    arrays = {'keys': links.link_table.keys, 'rel': links.rel.values, 'triplet_counts': links.triplet_counts}
+    for name in ('prev_links', 'vp_paths'):
+        pair_counts = getattr(links, name)
+        pair_counts._merge()
+        arrays.update({name + '.pairs': pair_counts.pairs, name + '.counts': pair_counts.counts})
+    for name, column in [(name, getattr(links, name)) for name, dtype, width, labels in LINK_COLUMNS] + \
+            [('decisions', decisions)]:
+        arrays[name + '.values'] = column.values
+        arrays[name + '.present'] = column.present
+    for name, arr in arrays.iteritems():
+        np.save(os.path.join(tmp_dir, name + '.npy'), arr)
+    model.save(os.path.join(tmp_dir, 'model'))
+    state = {'version': STATE_VERSION, 'key': key, 'ixp': sorted(links.bgp_paths.ixp),
+             'paths': paths.save(tmp_dir)}
+    with open(os.path.join(tmp_dir, 'state.json'), 'w') as f:
+        json.dump(state, f)
+    old_dir = state_dir + '.old'
+    if os.path.exists(state_dir):
+        os.rename(state_dir, old_dir)
+    os.rename(tmp_dir, state_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    # later saves hard-link the base paths from the new directory
+    paths.directory = state_dir
+
+
+def load_state(state_dir, key, asn_org_file):
+    """Load a state saved by save_state for the same inputs.
+
+    Returns (links, model, decisions), links being ready for
+    apply_path_delta with a SavedPaths as bgp_paths.forward_paths. Arrays
+    are memory-mapped, copy-on-write for those a delta updates, so loading
+    reads little more than the link keys. Raises ValueError if the state
+    was saved by another version or for other inputs.
+    """
+    try:
+        with open(os.path.join(state_dir, 'state.json')) as f:
+            state = json.load(f)
+    except (IOError, ValueError):
+        raise ValueError('%s is not a saved state of this version of ProbLink.' % state_dir)
+    if state.get('version') != STATE_VERSION:
+        raise ValueError('%s was saved by another version of ProbLink.' % state_dir)
+    if state['key'] != key:
+        raise ValueError('%s was saved for other bootstrap, PeeringDB or AS-org files.' % state_dir)
+
+    path = BgpPaths()
+    path.ixp = set(str(asn) for asn in state['ixp'])
+    path.forward_paths = SavedPaths.load(state_dir, state['paths'])
+    links = Links(path)
+    table = links.link_table = LinkTable(keys=_load_array(state_dir, 'keys'))
+    links.set_rel_columns(_load_array(state_dir, 'rel'))
+    links.extract_siblings(asn_org_file)
+    for name, dtype, width, labels in LINK_COLUMNS:
+        setattr(links, name, LinkColumn(table, _load_array(state_dir, name + '.values', 'c'),
+                                        _load_array(state_dir, name + '.present', 'c'), labels))
+    links.triplet_counts = _load_array(state_dir, 'triplet_counts', 'c')
+    links.prev_links = PairCounts(_load_array(state_dir, 'prev_links.pairs'),
+                                  _load_array(state_dir, 'prev_links.counts', 'c'))
+    links.vp_paths = PairCounts(_load_array(state_dir, 'vp_paths.pairs'),
+                                _load_array(state_dir, 'vp_paths.counts', 'c'))
+    links.compute_prev_p2p_p2c()
+    decisions = LinkColumn(table, _load_array(state_dir, 'decisions.values', 'c'),
+                           _load_array(state_dir, 'decisions.present', 'c'))
+    return links, ProblinkModel.load(os.path.join(state_dir, 'model')), decisions
+
+
+def read_paths(path_file, ixp):
+    """Read lines of sanitized_rib.txt and return them as the paths problink parses them into.
+
+    Each line stands for its own path, so withdrawing a line withdraws its path
+    even if another remaining line sanitizes to the same path.
+    """
+    paths = []
+    with open_input(path_file) as f:
+        for line in f:
+            asn_list = sanitize_path(line, ixp)
+            if asn_list is not None:
+                paths.append("|".join(asn_list))
+    return paths
+
+
+def count_extra_lines(rib_file, ixp):
+    """Map each path that several lines of rib_file sanitize to, to its number of lines minus one."""
+    extra_lines = {}
+    seen = set()
+    with open_input(rib_file) as f:
+        for line in f:
+            asn_list = sanitize_path(line, ixp)
+            if asn_list is not None:
+                path = "|".join(asn_list)
+                if path in seen:
+                    extra_lines[path] = extra_lines.get(path, 0) + 1
+                else:
+                    seen.add(path)
+    return extra_lines
+
+
+def net_path_delta(paths, added, withdrawn):
+    """Turn added and withdrawn lines into the paths that enter and leave paths, a SavedPaths.
+
+    A path only leaves once all the lines behind it are withdrawn; the extra
+    lines of paths are updated. Returns (added paths, withdrawn paths).
+    """
+    removed = set()
+    net_withdrawn = []
+    for path in withdrawn:
+        extra_lines = paths.extra_lines(path)
+        if extra_lines:
+            paths.set_extra_lines(path, extra_lines - 1)
+        elif path in paths and path not in removed:
+            removed.add(path)
+            net_withdrawn.append(path)
+    entered = set()
+    net_added = []
+    for path in added:
+        if (path in paths and path not in removed) or path in entered:
+            paths.set_extra_lines(path, paths.extra_lines(path) + 1)
+        else:
+            entered.add(path)
+            net_added.append(path)
+    return net_added, net_withdrawn
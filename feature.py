@@ -1,7 +1,13 @@
 from collections import defaultdict
-from link import Links
+from link import Links, TRIPLET_RELS
+from link_table import LinkColumn
+import numpy as np
 import pickle
 
+# the feature likelihood tables of ProblinkFeatures
+FEATURE_TABLES = ('triplet_feature', 'nonpath_feature', 'distance_to_tier1_feature',
+                  'vp_feature', 'colocated_ixp_feature', 'colocated_facility_feature')
+
 
 class ProblinkFeatures(object):
     """Class for computing feature likelihoods given BGP paths
@@ -24,9 +30,9 @@ class ProblinkFeatures(object):
         for k, v in link_feature.iteritems():
             if k in self.links.prob:
                 if is_triplet_feature:
-                    for adjacent_links_rel in v:
-                        feature_likelihood[adjacent_links_rel] = [x + y for x, y in zip(feature_likelihood[adjacent_links_rel], self.links.prob[k])]
-                        count_class = map(lambda x, y: x + y, self.links.prob[k], count_class)
+                    for adjacent_links_rel, n in self.links.triplet_histogram(k):
+                        feature_likelihood[adjacent_links_rel] = [x + n * y for x, y in zip(feature_likelihood[adjacent_links_rel], self.links.prob[k])]
+                        count_class = map(lambda x, y: n * x + y, self.links.prob[k], count_class)
                 else:
                     feature_likelihood[v] = [x + y for x, y in zip(feature_likelihood[v], self.links.prob[k])]
                     count_class = map(lambda x, y: x + y, self.links.prob[k], count_class)
@@ -35,8 +41,89 @@ class ProblinkFeatures(object):
             # Laplace smoothing
             feature_likelihood[i] = [(x+1)/(y+len(feature_likelihood)) for x, y in zip(feature_likelihood[i], count_class)]
 
-    def compute_feature_likelihoods(self):
+    def _prob_matrix(self):
+        """Return a (num_links, 3) matrix of link type probabilities and each link's row in it.
+
+        For a LinkColumn prob the matrix is the column itself and its rows are
+        the LinkTable rows, given as None.
+        """
+        if isinstance(self.links.prob, LinkColumn):
+            return self.links.prob.values, None
+        links = list(self.links.prob)
+        row = dict((link, i) for i, link in enumerate(links))
+        prob = np.array([self.links.prob[link] for link in links], dtype=np.float64).reshape(-1, 3)
+        return prob, row
+
+    def _compute_likelihood_vectorized(self, link_feature, feature_likelihood, prob, row):
+        """NumPy version of _compute_likelihood for non-triplet features.
+
+        Feature values are factorized into integer codes so that class-conditional
+        sums become weighted bincounts over the (num_links, 3) prob matrix.
+        """
+        value_code = {}
+        values, codes = [], []
+        link_values, rows = self._feature_rows(link_feature, row)
+        for v in link_values:
+            code = value_code.get(v)
+            if code is None:
+                code = value_code[v] = len(values)
+                values.append(v)
+            codes.append(code)
+        self._smooth(values, np.array(codes, dtype=np.intp), prob[rows], feature_likelihood)
+
+    def _compute_triplet_likelihood_vectorized(self, feature_likelihood, prob, row):
+        """NumPy version of _compute_likelihood for the triplet feature.
+
+        Each non-zero (link, triplet type) count of the histogram contributes
+        count * P(link type), in the same link-major order as the loop engine.
+        """
+        triplet_rows, prob_rows = self._feature_rows(self.links.triplet_rel, row)
+        counts = np.frombuffer(self.links.triplet_counts, dtype=np.uint32).reshape(-1, len(TRIPLET_RELS))[triplet_rows]
+        link_index, triplet_index = np.nonzero(counts)
+        weights = counts[link_index, triplet_index][:, None] * prob[prob_rows][link_index]
+        present, codes = np.unique(triplet_index, return_inverse=True)
+        self._smooth([TRIPLET_RELS[i] for i in present], codes, weights, feature_likelihood)
+
+    def _feature_rows(self, link_feature, row):
+        """Values of link_feature, in its iteration order, and the prob matrix rows of their links.
+
+        Links that are not in prob are skipped.
+        """
+        if row is None and isinstance(link_feature, LinkColumn):
+            rows = link_feature.rows()
+            return link_feature.row_values(rows), rows
+        values, rows = [], []
+        for k, v in link_feature.iteritems():
+            i = row.get(k) if row is not None else self.links.link_table.row(k)
+            if i is not None and i >= 0:
+                values.append(v)
+                rows.append(i)
+        return values, rows
+
+    def _smooth(self, values, codes, weights, feature_likelihood):
+        """Sum weights per feature value and class, then apply Laplace smoothing."""
+        if not values:
+            return
+        count_value = np.column_stack([np.bincount(codes, weights=weights[:, c], minlength=len(values)) for c in range(3)])
+        # a single-bin bincount sums sequentially, matching the loop engine's rounding
+        single_bin = np.zeros(len(codes), dtype=np.intp)
+        count_class = np.array([np.bincount(single_bin, weights=weights[:, c], minlength=1)[0] for c in range(3)])
+        likelihood = (count_value + 1) / (count_class + len(values))
+        for value, p in zip(values, likelihood.tolist()):
+            feature_likelihood[value] = p
+
+    def compute_feature_likelihoods(self, vectorized=True):
         """Compute likelihoods of all the features"""
+        if vectorized:
+            prob, row = self._prob_matrix()
+            self._compute_triplet_likelihood_vectorized(self.triplet_feature, prob, row)
+            for link_feature, feature_likelihood in ((self.links.nonpath, self.nonpath_feature),
+                                                     (self.links.distance_to_tier1, self.distance_to_tier1_feature),
+                                                     (self.links.vp, self.vp_feature),
+                                                     (self.links.colocated_ixp, self.colocated_ixp_feature),
+                                                     (self.links.colocated_facility, self.colocated_facility_feature)):
+                self._compute_likelihood_vectorized(link_feature, feature_likelihood, prob, row)
+            return
         self._compute_likelihood(self.links.triplet_rel, self.triplet_feature, True)
         self._compute_likelihood(self.links.nonpath, self.nonpath_feature)
         self._compute_likelihood(self.links.distance_to_tier1, self.distance_to_tier1_feature)
@@ -44,7 +131,19 @@ class ProblinkFeatures(object):
         self._compute_likelihood(self.links.colocated_ixp, self.colocated_ixp_feature)
         self._compute_likelihood(self.links.colocated_facility, self.colocated_facility_feature)
 
+    def tables(self):
+        """The six feature likelihood tables as plain dicts, in FEATURE_TABLES order."""
+        return tuple(dict(getattr(self, name)) for name in FEATURE_TABLES)
+
+    def set_tables(self, tables):
+        """Set the feature likelihood tables from the output of tables()."""
+        for name, table in zip(FEATURE_TABLES, tables):
+            getattr(self, name).clear()
+            getattr(self, name).update(table)
+
     def dump_feature(self, save_filename, feature):
-        fileObject = open(save_filename, 'w')
-        pickle.dump(feature, fileObject)
+        """Pickle one feature likelihood table as a plain dict, which unlike
+        the defaultdict (with its lambda default) can be loaded back."""
+        fileObject = open(save_filename, 'wb')
+        pickle.dump(dict(feature), fileObject)
         fileObject.close()
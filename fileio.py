@@ -0,0 +1,141 @@
+import bz2
+import gzip
+import threading
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+COMPRESSION_SUFFIXES = ('.gz', '.bz2', '.xz')
+
+
+def is_compressed(filename):
+    return filename.endswith(COMPRESSION_SUFFIXES)
+
+
+def strip_compression_suffix(filename):
+    """Drop a trailing .gz/.bz2/.xz so the underlying format can be detected."""
+    for suffix in COMPRESSION_SUFFIXES:
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+def open_input(filename, block_size=1 << 20, queue_size=16):
+    """Open a plain or compressed (.gz, .bz2, .xz) input file for reading.
+
+    Compressed files are decompressed as a stream by a background thread,
+    so decompression overlaps with parsing and nothing is written to disk.
+    """
+    if filename.endswith('.gz'):
+        raw = gzip.open(filename, 'rb')
+    elif filename.endswith('.bz2'):
+        raw = bz2.BZ2File(filename, 'rb')
+    elif filename.endswith('.xz'):
+        if lzma is None:
+            raise ImportError('reading .xz files requires the lzma module (backports.lzma on Python 2).')
+        raw = lzma.LZMAFile(filename, 'rb')
+    else:
+        return open(filename)
+    return ThreadedReader(raw, block_size, queue_size)
+
+
+class ThreadedReader(object):
+    """Read-only file object whose blocks are produced by a background thread."""
+    def __init__(self, raw, block_size, queue_size):
+        self.raw = raw
+        self.block_size = block_size
+        self._blocks = queue.Queue(queue_size)
+        self._buffer = b''
+        self._eof = False
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._fill)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _fill(self):
+        try:
+            while not self._closed:
+                block = self.raw.read(self.block_size)
+                if not block:
+                    break
+                self._blocks.put(block)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._blocks.put(None)
+
+    def _next_block(self):
+        if self._eof:
+            return b''
+        block = self._blocks.get()
+        if block is None:
+            self._eof = True
+            if self._error is not None:
+                raise self._error
+            return b''
+        return block
+
+    def read(self, size=-1):
+        if size < 0:
+            chunks = [self._buffer]
+            block = self._next_block()
+            while block:
+                chunks.append(block)
+                block = self._next_block()
+            self._buffer = b''
+            return b''.join(chunks)
+        while len(self._buffer) < size:
+            block = self._next_block()
+            if not block:
+                break
+            self._buffer += block
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self):
+        while b'\n' not in self._buffer:
+            block = self._next_block()
+            if not block:
+                break
+            self._buffer += block
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+        return line
+
+    def __iter__(self):
+        while True:
+            block = self._next_block()
+            if not block:
+                break
+            lines = (self._buffer + block).split(b'\n')
+            self._buffer = lines.pop()
+            for line in lines:
+                yield line + b'\n'
+        if self._buffer:
+            line, self._buffer = self._buffer, b''
+            yield line
+
+    def close(self):
+        self._closed = True
+        # unblock the reader thread if it is waiting on a full queue
+        while self._thread.is_alive():
+            try:
+                self._blocks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -3,6 +3,7 @@ Simple class for working with unweighted undirected graphs
 @author: Oleksii Kuchaiev; http://www.kuchaev.com
 '''
 import random
+import sys
 class graph(object):
     '''
     A class for representing and manipulation undirected, unweighted simple graphs without self-loops
@@ -278,59 +279,10 @@ class graph(object):
         return Distances
     def find_all_cliques(self):
         '''
-        Implements Bron-Kerbosch algorithm, Version 2
-        '''
-        Cliques=[]
-        Stack=[]
-        nd=None
-        disc_num=len(self.Nodes)
-        search_node=(set(),set(self.Nodes),set(),nd,disc_num) 
-        Stack.append(search_node)
-        while len(Stack)!=0:
-            (c_compsub,c_candidates,c_not,c_nd,c_disc_num)=Stack.pop()
-            if len(c_candidates)==0 and len(c_not)==0:
-                if len(c_compsub)>2:
-                    Cliques.append(c_compsub)
-                    continue
-            for u in list(c_candidates):
-                if (c_nd==None) or (not self.are_adjacent(u, c_nd)):
-                    c_candidates.remove(u)
-                    Nu=self.get_node_neighbors(u)                                
-                    new_compsub=set(c_compsub)
-                    new_compsub.add(u)
-                    new_candidates=set(c_candidates.intersection(Nu))
-                    new_not=set(c_not.intersection(Nu))                    
-                    if c_nd!=None:
-                        if c_nd in new_not:
-                            new_disc_num=c_disc_num-1
-                            if new_disc_num>0:
-                                new_search_node=(new_compsub,new_candidates,new_not,c_nd,new_disc_num)                        
-                                Stack.append(new_search_node)
-                        else:
-                            new_disc_num=len(self.Nodes)
-                            new_nd=c_nd
-                            for cand_nd in new_not:
-                                cand_disc_num=len(new_candidates)-len(new_candidates.intersection(self.get_node_neighbors(cand_nd))) 
-                                if cand_disc_num<new_disc_num:
-                                    new_disc_num=cand_disc_num
-                                    new_nd=cand_nd
-                            new_search_node=(new_compsub,new_candidates,new_not,new_nd,new_disc_num)                        
-                            Stack.append(new_search_node)                
-                    else:
-                        new_search_node=(new_compsub,new_candidates,new_not,c_nd,c_disc_num)
-                        Stack.append(new_search_node)
-                    c_not.add(u) 
-                    new_disc_num=0
-                    for x in c_candidates:
-                        if not self.are_adjacent(x, u):
-                            new_disc_num+=1
-                    if new_disc_num<c_disc_num and new_disc_num>0:
-                        new1_search_node=(c_compsub,c_candidates,c_not,u,new_disc_num)
-                        Stack.append(new1_search_node)
-                    else:
-                        new1_search_node=(c_compsub,c_candidates,c_not,c_nd,c_disc_num)
-                        Stack.append(new1_search_node)     
-        return Cliques
+        Returns the maximal cliques of more than two nodes, as sets.
+        Uses Bron-Kerbosch with Tomita pivoting on bitsets, see maximal_cliques.
+        '''
+        return maximal_cliques((nd1,nd2) for nd1 in self.AdjList for nd2 in self.AdjList[nd1])
     def create_empty_graph(self,n):
         '''
         creates graph with n nodes but without edges
@@ -405,4 +357,76 @@ class graph(object):
         
         
             
-            
\ No newline at end of file
+            
+
+def maximal_cliques(edges,min_size=3):
+    '''
+    Maximal cliques of at least min_size nodes, as sets, of the graph given by
+    an iterable of edges (nd1,nd2); nodes without edges are in no such clique.
+    Implements Bron-Kerbosch with Tomita pivoting, with the candidate, excluded
+    and neighbor sets kept as bitsets (Python ints) over node indexes.
+    '''
+    index={}
+    adj=[]
+    for nd1,nd2 in edges:
+        if nd1==nd2:
+            continue
+        for nd in (nd1,nd2):
+            if nd not in index:
+                index[nd]=len(adj)
+                adj.append(0)
+        adj[index[nd1]]|=1<<index[nd2]
+        adj[index[nd2]]|=1<<index[nd1]
+    nodes=sorted(index,key=index.get)
+    return [set(nodes[i] for i in clique) for clique in _bitset_cliques(adj,min_size)]
+
+def _bitset_cliques(adj,min_size):
+    '''
+    Maximal cliques of at least min_size nodes, as lists of node indexes, of the
+    graph whose node i has the neighbor bitset adj[i].
+    '''
+    cliques=[]
+    def expand(clique,candidates,excluded):
+        if not candidates:
+            if not excluded and len(clique)>=min_size:
+                cliques.append(clique)
+            return
+        if len(clique)+bin(candidates).count('1')<min_size:
+            return
+        # the pivot has the most neighbors among the candidates; only the
+        # candidates it is not adjacent to need to be branched on
+        best=-1
+        rest=candidates|excluded
+        while rest:
+            low=rest&-rest
+            rest^=low
+            nd=low.bit_length()-1
+            count=bin(candidates&adj[nd]).count('1')
+            if count>best:
+                best=count
+                pivot=nd
+        branch=candidates&~adj[pivot]
+        while branch:
+            low=branch&-branch
+            branch^=low
+            nd=low.bit_length()-1
+            expand(clique+[nd],candidates&adj[nd],excluded&adj[nd])
+            candidates^=low
+            excluded|=low
+    expand([],(1<<len(adj))-1,0)
+    return cliques
+
+def clique_worker(stdin=sys.stdin,stdout=sys.stdout):
+    '''
+    Answers clique requests until the end of stdin, so that a caller such as
+    asrank.pl keeps one interpreter for all of its clique computations.
+    A request is one line of whitespace-separated node pairs, each an edge:
+    "nd1 nd2 nd1 nd2 ...". The response is one line per maximal clique of
+    more than two nodes, its nodes separated by spaces, then an empty line.
+    '''
+    for line in iter(stdin.readline,''):
+        nodes=line.split()
+        for clique in maximal_cliques(zip(nodes[0::2],nodes[1::2])):
+            stdout.write(' '.join(sorted(clique))+'\n')
+        stdout.write('\n')
+        stdout.flush()
@@ -1,10 +1,71 @@
 from bgp_path_parser import BgpPaths
-import networkx as nx
 from collections import defaultdict
+from array import array
+from itertools import count, imap, izip
+from multiprocessing import Process, Queue
+from Queue import Empty
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+import traceback
 import numpy as np
-import json
-import sqlite3
-from itertools import permutations
+from fileio import open_input
+from peeringdb import load_peeringdb
+from csr_graph import CSRGraph
+from link_table import LinkTable, LinkColumn, PairCounts, asn_number, unpack_link
+import profiling
+
+# link types seen before and after a link on a path; 'NULL' marks a path end
+LINK_RELS = ('NULL', 'p2p', 'p2c', 'c2p')
+REL_INDEX = dict((rel, i) for i, rel in enumerate(LINK_RELS))
+# every (previous link type, next link type) pair, in triplet histogram order
+TRIPLET_RELS = [(prev_rel, next_rel) for prev_rel in LINK_RELS for next_rel in LINK_RELS]
+# per-link attributes that a columnar ingest_prob allocates as LinkTable columns: (name, dtype, tuple width, labels)
+LINK_COLUMNS = (('triplet_rel', np.int64, None, None),
+                ('nonpath', np.int32, None, None),
+                ('distance_to_tier1', np.int32, 2, None),
+                ('vp', np.int32, None, None),
+                ('colocated_ixp', np.int32, None, None),
+                ('colocated_facility', np.int32, None, None))
+# paths walked at a time by the columnar attribute builders
+PATH_CHUNK = 1 << 12
+# seconds between checks that running builder workers are still alive
+WORKER_POLL_S = 1.0
+
+
+class Siblings(object):
+    """Sibling relation backed by an ASN -> organization id map.
+
+    (AS1, AS2) in siblings holds when two different ASes share an organization,
+    which answers the same membership queries as the set of all ordered
+    sibling pairs without materializing it.
+    """
+    def __init__(self):
+        self.org = {}
+        # organizations of ASNs listed under more than one organization
+        self.extra_orgs = defaultdict(set)
+
+    def add(self, asn, org_id):
+        if asn in self.org and self.org[asn] != org_id:
+            self.extra_orgs[asn].update((self.org[asn], org_id))
+        else:
+            self.org[asn] = org_id
+
+    def orgs(self, asn):
+        if asn in self.extra_orgs:
+            return self.extra_orgs[asn]
+        return (self.org[asn],)
+
+    def __contains__(self, link):
+        AS1, AS2 = link
+        if AS1 == AS2 or AS1 not in self.org or AS2 not in self.org:
+            return False
+        if self.org[AS1] == self.org[AS2]:
+            return True
+        if AS1 in self.extra_orgs or AS2 in self.extra_orgs:
+            return not set(self.orgs(AS1)).isdisjoint(self.orgs(AS2))
+        return False
 
 
 class Links(object):
@@ -17,8 +78,9 @@ class Links(object):
 
         self.prob = {}
         self.rel = {}
-        self.siblings = set()
+        self.siblings = Siblings()
         self.triplet_rel = {}
+        self.triplet_counts = array('I')
         self.prev_p2p_p2c = defaultdict(set)
         self.prev_links = defaultdict(set)
         self.nonpath = {}
@@ -26,15 +88,20 @@ class Links(object):
         self.vp = {}
         self.colocated_ixp = defaultdict(int)
         self.colocated_facility = defaultdict(int)
+        self.link_table = None
 
-    def ingest_prob(self, bootstrap_rel_file):
+    def ingest_prob(self, bootstrap_rel_file, columnar=False):
         """Initialize deterministic relationship probabilities and relationships
         from bootstrapping algorithms such as AS-Rank and CoreToLeaf.
 
         The key of self.prob dictionary is a link pair,
         and the value is a tuple (probability of the link being p2p, p2c, c2p).
+        With columnar, the links and all their attributes are kept in a
+        LinkTable and its columns instead, see _ingest_columns.
         """
-        with open(bootstrap_rel_file) as f:
+        if columnar and self._ingest_columns(bootstrap_rel_file):
+            return
+        with open_input(bootstrap_rel_file) as f:
             for line in f:
                 if not line.startswith("#"):
                     AS1, AS2, rel = line.strip().split("|")
@@ -49,79 +116,232 @@ class Links(object):
                         self.rel[(AS1, AS2)] = 'p2c'
                         self.rel[(AS2, AS1)] = 'c2p'
 
+    def _ingest_columns(self, bootstrap_rel_file):
+        """Columnar ingest_prob: read the links into self.link_table and allocate their columns.
+
+        prob and rel become LinkColumns that iterate and hold values as the
+        dicts would: in the same order, with the type of the last line that
+        sets a link. The builders of construct_attributes then write into the
+        columns of _allocate_columns. Returns False, with nothing changed, if
+        an ASN cannot be packed into a link key.
+        """
+        numbers = array('I')
+        transit = array('B')
+        with open_input(bootstrap_rel_file) as f:
+            for line in f:
+                if not line.startswith("#"):
+                    AS1, AS2, rel = line.strip().split("|")
+                    if rel == '0' or rel == '-1':
+                        try:
+                            numbers.extend((asn_number(AS1), asn_number(AS2)))
+                        except ValueError as e:
+                            print('%s Keeping link attributes in dicts...' % e)
+                            return False
+                        transit.append(rel == '-1')
+        ases = np.frombuffer(numbers, dtype=np.uint32).astype(np.uint64).reshape(-1, 2)
+        AS1, AS2 = ases[:, 0], ases[:, 1]
+        transit = np.frombuffer(transit, dtype=np.bool_)
+        # (AS1, AS2), then (AS2, AS1) for every line
+        keys = np.column_stack((AS1 << np.uint64(32) | AS2, AS2 << np.uint64(32) | AS1)).ravel()
+        rels = np.column_stack((np.where(transit, REL_INDEX['p2c'], REL_INDEX['p2p']),
+                                np.where(transit, REL_INDEX['c2p'], REL_INDEX['p2p']))).ravel()
+        unique, first = np.unique(keys, return_index=True)
+        last = len(keys) - 1 - np.unique(keys[::-1], return_index=True)[1]
+        order = np.argsort(first, kind='mergesort')
+        # the dicts iterate in hash order, which only a dict of the links, set in
+        # the same order, reproduces; it holds no values and is dropped right away
+        rows = dict(izip(imap(unpack_link, unique[order].tolist()), count()))
+        order = order[np.fromiter(rows.itervalues(), dtype=np.int64, count=len(rows))]
+        del rows
+        rels = rels[last[order]].astype(np.uint8)
+        self.link_table = LinkTable(keys=unique[order])
+        self.set_rel_columns(rels)
+        self._allocate_columns()
+        return True
+
+    def set_rel_columns(self, rels):
+        """Set prob and rel as LinkColumns of self.link_table from an array of the
+        LINK_RELS index of each row's type."""
+        # p2p, p2c and c2p are rel 1, 2 and 3, and probabilities (1, 0, 0), (0, 1, 0) and (0, 0, 1)
+        self.prob = LinkColumn(self.link_table, np.eye(3)[rels - 1])
+        self.rel = LinkColumn(self.link_table, rels, labels=LINK_RELS)
+
+    def _allocate_columns(self):
+        """Allocate empty attributes for the links of self.link_table: LinkColumns for
+        LINK_COLUMNS, triplet_counts rows that are the table rows, prev_p2p_p2c as a
+        bool array over the rows and prev_links as PairCounts of the forward paths
+        behind each (link row, previous link row) pair."""
+        for name, dtype, width, labels in LINK_COLUMNS:
+            setattr(self, name, self.link_table.empty_column(dtype, width, labels))
+        self.triplet_counts = np.zeros(len(self.link_table) * len(TRIPLET_RELS), dtype=np.uint32)
+        self.prev_p2p_p2c = np.zeros(len(self.link_table), dtype=bool)
+        self.prev_links = PairCounts()
+
     def extract_siblings(self, asn_org_file):
         format_counter = 0
-        org_asn = defaultdict(list)
-        with open(asn_org_file) as f:
+        with open_input(asn_org_file) as f:
             for line in f:
                 if format_counter == 2:
                     asn = line.split('|')[0]
                     org_id = line.split('|')[3]
-                    org_asn[org_id].append(asn)
+                    self.siblings.add(asn, org_id)
                 if line.startswith("# format"):
                     format_counter += 1
 
-        for k, v in org_asn.iteritems():
-            sibling_perm = permutations(v, 2)
-            for i in sibling_perm:
-                self.siblings.add(i)
-
     def assign_triplet_rel(self):
-        """What are the previous and next link types in each link triplet."""
-        for path in (self.bgp_paths.forward_paths | self.bgp_paths.reverse_paths):
-            flag = 1
-            ASes = path.split("|")
-            for i in range(len(ASes) - 1):
-                if (ASes[i], ASes[i+1]) not in self.prob:
-                    flag = 0
-            if flag == 1:
-                # insert a "NULL" link in front of and behind each BGP path
-                link_list = ['NULL']
-                for i in range(len(ASes) - 1):
-                    if (ASes[i], ASes[i+1]) not in self.siblings:
-                        link_list.append((ASes[i], ASes[i+1]))
-                link_list.append('NULL')
-                if len(link_list) != 2:
-                    for i in range(1, len(link_list)-1):
-                        if link_list[i] not in self.triplet_rel:
-                            self.triplet_rel[link_list[i]] = []
-                        prev_link = link_list[i-1]
-                        next_link = link_list[i+1]
-                        if prev_link == 'NULL':
-                            prev_rel = 'NULL'
-                        else:
-                            prev_rel = self.rel[prev_link]
-                        if next_link == 'NULL':
-                            next_rel = 'NULL'
-                        else:
-                            next_rel = self.rel[next_link]
-                        self.triplet_rel[link_list[i]].append((prev_rel, next_rel))
+        """What are the previous and next link types in each link triplet.
+
+        triplet_rel maps a link to its row in triplet_counts, a flat array of
+        len(TRIPLET_RELS) counts per link: how many times the link was seen
+        with each (previous, next) pair of link types.
+        """
+        if self.link_table is not None:
+            self._walk_columns(self.bgp_paths.iter_paths_with_reverse(), triplets=True)
+            return
+        for ASes in self.bgp_paths.iter_all_paths():
+            self._add_triplets([(ASes[i], ASes[i+1]) for i in range(len(ASes) - 1)])
+
+    def _add_path_triplets(self, links, reverse_new):
+        """_add_triplets for a forward path, given as its list of links, and for its
+        reverse if reverse_new."""
+        self._add_triplets(links)
+        if reverse_new:
+            self._add_triplets([(AS2, AS1) for AS1, AS2 in reversed(links)])
+
+    def _add_triplets(self, links):
+        """Append the (previous, next) link types of every link on a path, given as
+        its list of links, to triplet_rel. Paths with links of unknown type are skipped."""
+        for link in links:
+            if link not in self.prob:
+                return
+        # links between siblings are dropped from the triplet sequence
+        link_list = [link for link in links if link not in self.siblings]
+        if link_list:
+            # a "NULL" link in front of and behind each BGP path
+            rels = [0] + [REL_INDEX[self.rel[link]] for link in link_list] + [0]
+            width = len(TRIPLET_RELS)
+            for i, link in enumerate(link_list):
+                row = self.triplet_rel.get(link)
+                if row is None:
+                    row = self.triplet_rel[link] = len(self.triplet_counts) // width
+                    self.triplet_counts.extend([0] * width)
+                self.triplet_counts[row * width + rels[i] * len(LINK_RELS) + rels[i+2]] += 1
+
+    def triplet_histogram(self, link):
+        """Return the (previous, next) link type pairs seen around a link with their counts."""
+        width = len(TRIPLET_RELS)
+        row = self.triplet_rel[link] * width
+        counts = self.triplet_counts[row:row + width]
+        return [(TRIPLET_RELS[i], n) for i, n in enumerate(counts) if n]
+
+    def recompute_type_attributes(self):
+        """Rebuild the attributes that depend on current link types, after self.rel and
+        self.prob changed: triplet_rel, prev_p2p_p2c and nonpath.
+
+        Path-only attributes (prev_links, vp) and colocation are left as they are.
+        """
+        self.triplet_rel = {}
+        self.triplet_counts = array('I')
+        for ASes, reverse_new in self.bgp_paths.iter_paths_with_reverse():
+            self._add_path_triplets([(ASes[i], ASes[i+1]) for i in xrange(len(ASes) - 1)], reverse_new)
+        self.prev_p2p_p2c = defaultdict(set)
+        self.nonpath = {}
+        self.compute_prev_p2p_p2c()
+        self.assign_nonpath()
 
     def compute_prev_links(self):
         """Compute adjacent previous links of all the ASes."""
-        for path in self.bgp_paths.forward_paths:
-            ASes = path.split('|')
+        if self.link_table is not None:
+            self._walk_columns(((ASes, False) for ASes in self.bgp_paths.iter_forward_paths()), prev_links=True)
+            return
+        for ASes in self.bgp_paths.iter_forward_paths():
             for i in xrange(len(ASes) - 2):
                 self.prev_links[(ASes[i+1], ASes[i+2])].add((ASes[i], ASes[i+1]))
 
+    def _prob_matrix(self):
+        """Return the links of self.prob, their (num_links, 3) probability matrix
+        and a function giving the row of a link, -1 if it is not in self.prob."""
+        links = list(self.prob)
+        index = dict((link, i) for i, link in enumerate(links))
+        prob = np.array([self.prob[link] for link in links], dtype=np.float64).reshape(-1, 3)
+        return links, prob, lambda link: index.get(link, -1)
+
     def compute_prev_p2p_p2c(self):
-        """Compute adjacent previous p2p/p2c links of links based on current link types."""
-        for link in self.prob:
-            p2p, p2c, c2p = map(lambda x: np.float128(x), self.prob[link])
-            if p2p > c2p or p2c > c2p:
-                self.prev_p2p_p2c[link[1]].add(link)
+        """Compute adjacent previous p2p/p2c links of links based on current link types.
+
+        In columnar mode prev_p2p_p2c marks the table rows of those links instead.
+        """
+        if self.link_table is not None:
+            prob = self.prob.values
+            self.prev_p2p_p2c = (prob[:, 0] > prob[:, 2]) | (prob[:, 1] > prob[:, 2])
+            return
+        links, prob, row = self._prob_matrix()
+        # float64 compares like the np.float128 values they convert to exactly
+        p2p_p2c = (prob[:, 0] > prob[:, 2]) | (prob[:, 1] > prob[:, 2])
+        for i in np.flatnonzero(p2p_p2c).tolist():
+            link = links[i]
+            self.prev_p2p_p2c[link[1]].add(link)
 
     def assign_nonpath(self):
-        """How many adjacent p2p or p2c links a link has, but none of them appear before this link on any of the paths."""
-        for link in self.prob:
-            if not any(i in self.prev_links[link] for i in self.prev_p2p_p2c[link[0]]):
-                self.nonpath[link] = len(self.prev_p2p_p2c[link[0]])
+        """How many adjacent p2p or p2c links a link has, but none of them appear before this link on any of the paths.
+
+        A link (AS2, AS3) has such a link (AS1, AS2) before it iff that link is in
+        both prev_links[(AS2, AS3)] and prev_p2p_p2c[AS2]. Since every link in
+        prev_links[(AS2, AS3)] ends at AS2, this is a join of the (previous
+        link, link) row pairs with the rows of prev_p2p_p2c links.
+        """
+        if self.link_table is not None:
+            self._assign_nonpath_columns()
+            return
+        links, prob, row = self._prob_matrix()
+        is_p2p_p2c = np.zeros(len(links), dtype=bool)
+        for prev_p2p_p2c in self.prev_p2p_p2c.itervalues():
+            for link in prev_p2p_p2c:
+                i = row(link)
+                if i >= 0:
+                    is_p2p_p2c[i] = True
+        prev_rows, link_rows = [], []
+        for link, prev_links in self.prev_links.iteritems():
+            i = row(link)
+            if i >= 0:
+                for prev_link in prev_links:
+                    j = row(prev_link)
+                    if j >= 0:
+                        prev_rows.append(j)
+                        link_rows.append(i)
+        prev_rows = np.array(prev_rows, dtype=np.intp)
+        link_rows = np.array(link_rows, dtype=np.intp)
+        has_prev = np.zeros(len(links), dtype=bool)
+        has_prev[link_rows[is_p2p_p2c[prev_rows]]] = True
+        for i in np.flatnonzero(~has_prev).tolist():
+            link = links[i]
+            self.nonpath[link] = len(self.prev_p2p_p2c.get(link[0], ()))
+
+    def _assign_nonpath_columns(self, rows=None):
+        """Columnar assign_nonpath, on the row pairs of prev_links and the rows of
+        prev_p2p_p2c; with an array of rows, for the links of those rows only."""
+        keys = self.link_table.keys
+        link_rows, prev_rows, counts = self.prev_links.arrays()
+        has_prev = np.zeros(len(keys), dtype=bool)
+        has_prev[link_rows[self.prev_p2p_p2c[prev_rows]]] = True
+        if rows is None:
+            rows = np.flatnonzero(~has_prev)
+        else:
+            self.nonpath.clear_rows(rows[has_prev[rows]])
+            rows = rows[~has_prev[rows]]
+        # len(prev_p2p_p2c[AS1]) of the dicts: how many p2p or p2c links end at AS1
+        ends = np.sort(keys[self.prev_p2p_p2c] & np.uint64(0xffffffff))
+        AS1 = keys[rows] >> np.uint64(32)
+        self.nonpath.set_rows(rows, np.searchsorted(ends, AS1, 'right') - np.searchsorted(ends, AS1, 'left'))
 
     def assign_vp(self):
         """How many vantage points observe a link."""
-        for path in self.bgp_paths.forward_paths:
-            if '|' in path:
-                ASes = path.split("|")
+        if self.link_table is not None:
+            self._walk_columns(((ASes, False) for ASes in self.bgp_paths.iter_forward_paths()),
+                               vp_paths=PairCounts())
+            return
+        for ASes in self.bgp_paths.iter_forward_paths():
+            if len(ASes) > 1:
                 vp = ASes[0]
                 for i in range(len(ASes)-1):
                     if (ASes[i], ASes[i+1]) not in self.vp:
@@ -131,103 +351,428 @@ class Links(object):
             if link in self.prob:
                 self.vp[link] = len(self.vp[link])
 
+    def walk_paths(self):
+        """Single-pass equivalent of assign_triplet_rel, compute_prev_links and assign_vp.
+
+        Each forward path is visited once; its reverse is walked for triplets
+        unless it is itself a forward path, so the union of forward and
+        reverse paths is never built.
+        """
+        if self.link_table is not None:
+            self._walk_columns(self.bgp_paths.iter_paths_with_reverse(), triplets=True, prev_links=True,
+                               vp_paths=PairCounts())
+            return
+        for ASes, reverse_new in self.bgp_paths.iter_paths_with_reverse():
+            links = [(ASes[i], ASes[i+1]) for i in xrange(len(ASes) - 1)]
+            self._add_path_triplets(links, reverse_new)
+            for i in xrange(1, len(links)):
+                self.prev_links[links[i]].add(links[i-1])
+            if links:
+                vp = ASes[0]
+                for link in links:
+                    if link not in self.vp:
+                        self.vp[link] = set()
+                    self.vp[link].add(vp)
+        for link in self.vp:
+            if link in self.prob:
+                self.vp[link] = len(self.vp[link])
+
+    def _chunk_links(self, paths, reverse=False):
+        """Yield the links of paths, given as (ASes, reverse_new) pairs, PATH_CHUNK paths at a time.
+
+        The ASNs of a chunk are interned to ids and its links looked up as an
+        array of packed keys. Yields (rows, link_path, forward, vps): the table
+        row of each link (-1 if it is not in the table) and the chunk path it
+        is on, which chunk paths are forward paths, and the ASN of the first AS
+        of each path (-1 if it is not a plain 32-bit ASN). With reverse, the
+        reverse of each path with reverse_new follows it.
+        """
+        asn_ids = {}
+        # ASN of each id, -1 for tokens that cannot be in a link key
+        asn_numbers = []
+        for chunk in _chunks(paths, PATH_CHUNK):
+            ids, lengths, forward = array('i'), array('i'), array('B')
+            for ASes, reverse_new in chunk:
+                path_ids = map(asn_ids.get, ASes)
+                if None in path_ids:
+                    for asn in ASes:
+                        if asn not in asn_ids:
+                            asn_ids[asn] = len(asn_numbers)
+                            try:
+                                asn_numbers.append(asn_number(asn))
+                            except ValueError:
+                                asn_numbers.append(-1)
+                    path_ids = map(asn_ids.get, ASes)
+                ids.extend(path_ids)
+                lengths.append(len(path_ids))
+                forward.append(True)
+                if reverse and reverse_new:
+                    ids.extend(reversed(path_ids))
+                    lengths.append(len(path_ids))
+                    forward.append(False)
+            ids = np.frombuffer(ids, dtype=np.int32)
+            lengths = np.frombuffer(lengths, dtype=np.int32)
+            forward = np.frombuffer(forward, dtype=np.bool_)
+
+            n_links = np.maximum(lengths - 1, 0)
+            link_path = np.repeat(np.arange(len(lengths)), n_links)
+            path_start = np.cumsum(lengths) - lengths
+            link_start = np.cumsum(n_links) - n_links
+            position = path_start[link_path] + np.arange(len(link_path)) - link_start[link_path]
+            numbers = np.array(asn_numbers, dtype=np.int64)
+            AS1, AS2 = numbers[ids[position]], numbers[ids[position + 1]]
+            valid = (AS1 >= 0) & (AS2 >= 0)
+            rows = np.full(len(position), -1, dtype=np.int64)
+            rows[valid] = self.link_table.rows(AS1[valid].astype(np.uint64) << np.uint64(32) |
+                                               AS2[valid].astype(np.uint64))
+            vps = np.full(len(lengths), -1, dtype=np.int64)
+            vps[lengths > 0] = numbers[ids[path_start[lengths > 0]]]
+            yield rows, link_path, forward, vps
+
+    def _walk_columns(self, paths, triplets=False, prev_links=False, vp_paths=None, weight=1):
+        """Columnar walk_paths over paths, given as (ASes, reverse_new) pairs: count the
+        triplets, (link, previous link) pairs and (link, vantage point) pairs of
+        table links weight times, into triplet_counts, prev_links and the
+        PairCounts vp_paths, and update triplet_rel and vp for the links walked.
+
+        Counts are added with array operations on the chunks of _chunk_links.
+        Reverse paths count for triplets only; vantage points are told apart by
+        ASN. Returns the rows of the table links on the paths.
+        """
+        table = self.link_table
+        width = len(TRIPLET_RELS)
+        if triplets:
+            rels = self.rel.values.astype(np.int64)
+            # links between siblings are dropped from the triplet sequence
+            not_sibling = np.array([link not in self.siblings for link in self.prob], dtype=bool)
+        walked = np.zeros(len(table), dtype=bool)
+        for rows, link_path, forward, vps in self._chunk_links(paths, triplets):
+            walked[rows[rows >= 0]] = True
+            if prev_links:
+                pair = (link_path[1:] == link_path[:-1]) & forward[link_path[1:]] & (rows[1:] >= 0) & (rows[:-1] >= 0)
+                self.prev_links.add(rows[1:][pair], rows[:-1][pair], weight)
+            if vp_paths is not None:
+                observed = forward[link_path] & (rows >= 0) & (vps[link_path] >= 0)
+                vp_paths.add(rows[observed], vps[link_path[observed]], weight)
+            if triplets:
+                # paths with links of unknown type are skipped
+                skipped = np.bincount(link_path[rows < 0], minlength=len(forward)) > 0
+                kept = ~skipped[link_path]
+                kept[kept] = not_sibling[rows[kept]]
+                kept_rows, kept_path = rows[kept], link_path[kept]
+                kept_rels = rels[kept_rows]
+                # a "NULL" link in front of and behind each BGP path
+                prev_rels = np.zeros(len(kept_rows), dtype=np.int64)
+                next_rels = np.zeros(len(kept_rows), dtype=np.int64)
+                same_path = kept_path[1:] == kept_path[:-1]
+                prev_rels[1:][same_path] = kept_rels[:-1][same_path]
+                next_rels[:-1][same_path] = kept_rels[1:][same_path]
+                cells, counts = np.unique(kept_rows * width + prev_rels * len(LINK_RELS) + next_rels,
+                                          return_counts=True)
+                # uint32 arithmetic wraps, so negative weights take counts back out
+                self.triplet_counts[cells] += (weight * counts).astype(np.uint32)
+
+        rows = np.flatnonzero(walked)
+        if triplets:
+            counted = self.triplet_counts.reshape(-1, width)[rows].any(axis=1)
+            self.triplet_rel.set_rows(rows[counted], rows[counted])
+            self.triplet_rel.clear_rows(rows[~counted])
+        if vp_paths is not None:
+            counts = vp_paths.distinct(rows)
+            self.vp.set_rows(rows[counts > 0], counts[counts > 0])
+            self.vp.clear_rows(rows[counts == 0])
+        return rows
+
+    def check_walk_paths(self):
+        """Compare walk_paths against the per-attribute methods.
+
+        Returns the names of the attributes on which they disagree.
+        """
+        separate, fused = Links(self.bgp_paths), Links(self.bgp_paths)
+        for links in (separate, fused):
+            links.prob, links.rel, links.siblings = self.prob, self.rel, self.siblings
+            if self.link_table is not None:
+                links.link_table = self.link_table
+                links._allocate_columns()
+        separate.assign_triplet_rel()
+        separate.compute_prev_links()
+        separate.assign_vp()
+        fused.walk_paths()
+
+        mismatched = []
+        if dict((k, separate.triplet_histogram(k)) for k in separate.triplet_rel) != \
+           dict((k, fused.triplet_histogram(k)) for k in fused.triplet_rel):
+            mismatched.append('triplet_rel')
+        if isinstance(separate.prev_links, PairCounts):
+            if separate.prev_links != fused.prev_links:
+                mismatched.append('prev_links')
+        elif dict((k, v) for k, v in separate.prev_links.iteritems() if v) != \
+                dict((k, v) for k, v in fused.prev_links.iteritems() if v):
+            mismatched.append('prev_links')
+        if separate.vp != fused.vp:
+            mismatched.append('vp')
+        return mismatched
+
+    def count_path_attributes(self):
+        """Count the forward paths behind every (link row, vantage point) pair into the
+        PairCounts vp_paths, which lets apply_path_delta take paths back out.
+
+        prev_links already counts the paths behind its pairs. Needs a columnar Links.
+        """
+        if self.link_table is None:
+            raise ValueError('path deltas need columnar link attributes.')
+        self.vp_paths = PairCounts()
+        self._walk_columns(((ASes, False) for ASes in self.bgp_paths.iter_forward_paths()), vp_paths=self.vp_paths)
+
+    def apply_path_delta(self, added, withdrawn):
+        """Update path-derived attributes for forward paths added to and withdrawn from bgp_paths.
+
+        Paths are '|'-joined strings; withdrawn paths that are not present and added
+        paths that already are, are ignored. Needs count_path_attributes() and
+        unchanged link types; bgp_paths.forward_paths only has to support in,
+        add and remove, like a set or a delta.SavedPaths. triplet_rel, vp,
+        prev_links and nonpath end up as a full construction on the new path set
+        would build them, for work in proportion to the changed paths.
+        Returns the set of links whose attributes changed.
+        """
+        if self.link_table is None:
+            raise ValueError('path deltas need columnar link attributes.')
+        forward_paths = self.bgp_paths.forward_paths
+        # changed forward paths, and those that change the forward/reverse union, by weight
+        changed = {-1: [], 1: []}
+        union_changed = {-1: [], 1: []}
+        for path, weight in [(path, -1) for path in withdrawn] + [(path, 1) for path in added]:
+            if (path in forward_paths) != (weight < 0):
+                continue
+            ASes = path.split("|")
+            if weight < 0:
+                forward_paths.remove(path)
+            changed[weight].append(ASes)
+            # the forward/reverse union only changes if the reverse is not a forward path
+            if "|".join(ASes[::-1]) not in forward_paths:
+                union_changed[weight].append(ASes)
+            if weight > 0:
+                forward_paths.add(path)
+
+        affected = np.zeros(len(self.link_table), dtype=bool)
+        prev_changed = np.zeros(len(self.link_table), dtype=bool)
+        for weight in (-1, 1):
+            if union_changed[weight]:
+                affected[self._walk_columns(((ASes, True) for ASes in union_changed[weight]),
+                                            triplets=True, weight=weight)] = True
+            if changed[weight]:
+                prev_changed[self._walk_columns(((ASes, False) for ASes in changed[weight]),
+                                                prev_links=True, vp_paths=self.vp_paths, weight=weight)] = True
+        self._assign_nonpath_columns(np.flatnonzero(prev_changed))
+        return set(imap(self.link_table.link, np.flatnonzero(affected | prev_changed).tolist()))
+
     def assign_distance_to_tier1(self):
         """Compute link's average distance to each Tier-1 AS, and round it to a multiple of 0.1."""
-        shortest_distance = defaultdict(dict)
-        shortest_distance_list = defaultdict(list)
-        g = nx.Graph()
-        for link in self.prob:
-            g.add_edge(link[0], link[1])
+        g = CSRGraph(self.prob)
         tier1s = ['174', '209', '286', '701', '1239', '1299', '2828', '2914', '3257', '3320', '3356', '4436', '5511', '6453', '6461', '6762', '7018', '12956', '3549']
+        sources = []
         for tier1_asn in tier1s:
             if tier1_asn not in g:
                 tier1s.remove(tier1_asn)
             else:
-                p = nx.shortest_path_length(g, source=tier1_asn)
-                for k, v in p.iteritems():
-                    if k not in shortest_distance or tier1_asn not in shortest_distance[k]:
-                        shortest_distance[k][tier1_asn] = v
-                        shortest_distance_list[k].append(v)
+                sources.append(tier1_asn)
+        if not sources:
+            return
+
+        dist = g.multi_source_bfs(sources)
+        reached = dist >= 0
+        count = reached.sum(axis=0)
+        total = np.where(reached, dist, 0).sum(axis=0)
+        # average over the Tier-1s that reach each AS, in units of 0.1
+        average = np.zeros(len(g), dtype=np.int64)
+        average[count > 0] = (total[count > 0].astype(np.float64) / count[count > 0] / 0.1).astype(np.int64)
+        average = average.tolist()
+        count = count.tolist()
 
         for link in self.prob:
             AS1, AS2 = link
-            if AS1 in shortest_distance and AS2 in shortest_distance:
-                dis_AS1 = int(sum(shortest_distance_list[AS1])/float(len(shortest_distance_list[AS1]))/0.1)
-                dis_AS2 = int(sum(shortest_distance_list[AS2])/float(len(shortest_distance_list[AS2]))/0.1)
-                self.distance_to_tier1[link] = (dis_AS1, dis_AS2)
+            id1, id2 = g.node_id[AS1], g.node_id[AS2]
+            if count[id1] and count[id2]:
+                self.distance_to_tier1[link] = (average[id1], average[id2])
 
-    def assign_colocated_ixp(self, peeringdb_file):
+    def assign_colocated_ixp(self, peeringdb):
         """How many IXPs that two ASes are co-located in."""
-        ixp_dict = {}
-        # PeeringDB json dump
-        if peeringdb_file.endswith('json'):
-            with open(peeringdb_file) as f:
-                data = json.load(f)
-            for i in data['netixlan']['data']:
-                AS, ixp = i['asn'], i['ixlan_id']
-                if ixp not in ixp_dict:
-                    ixp_dict[ixp] = [AS]
-                else:
-                    ixp_dict[ixp].append(AS)
-        # PeeringDB sqlite dump
-        elif peeringdb_file.endswith('sqlite'):
-            conn = sqlite3.connect(peeringdb_file)
-            c = conn.cursor()
-            for row in c.execute("SELECT asn, ixlan_id FROM 'peeringdb_network_ixlan'"):
-                AS, ixp = row[0], row[1]
-                if ixp not in ixp_dict:
-                    ixp_dict[ixp] = [AS]
-                else:
-                    ixp_dict[ixp].append(AS)
-
-        for k, v in ixp_dict.iteritems():
-            as_pairs = [(str(p1), str(p2)) for p1 in v for p2 in v if p1 != p2]
-            for pair in as_pairs:
-                self.colocated_ixp[(pair[0], pair[1])] += 1
-        for link in self.prob:
-            if link not in self.colocated_ixp:
-                self.colocated_ixp[link] = 0
+        self._count_colocations(load_peeringdb(peeringdb).as_ixps, self.colocated_ixp)
 
-    def assign_colocated_facility(self, peeringdb_file):
+    def assign_colocated_facility(self, peeringdb):
         """How many peering facilities that two ASes are co-located in."""
-        facility_dict = {}
-
-        # PeeringDB json dump
-        if peeringdb_file.endswith('json'):
-            with open(peeringdb_file) as f:
-                data = json.load(f)
-            for i in data['netfac']['data']:
-                AS, facility = i['local_asn'], i['fac_id']
-                if facility not in facility_dict:
-                    facility_dict[facility] = [AS]
-                else:
-                    facility_dict[facility].append(AS)
-        # PeeringDB sqlite dump
-        elif peeringdb_file.endswith('sqlite'):
-            conn = sqlite3.connect(peeringdb_file)
-            c = conn.cursor()
-            for row in c.execute("SELECT local_asn, fac_id FROM 'peeringdb_network_facility'"):
-                AS, facility = row[0], row[1]
-                if facility not in facility_dict:
-                    facility_dict[facility] = [AS]
-                else:
-                    facility_dict[facility].append(AS)
-
-        for k, v in facility_dict.iteritems():
-            as_pairs = [(str(p1), str(p2)) for p1 in v for p2 in v if p1 != p2]
-            for pair in as_pairs:
-                self.colocated_facility[(pair[0], pair[1])] += 1
+        self._count_colocations(load_peeringdb(peeringdb).as_facilities, self.colocated_facility)
+
+    def _count_colocations(self, as_locations, colocated):
+        """Count the locations shared by the two ASes of every link in self.prob.
+
+        as_locations maps an AS to {location id: number of membership records},
+        an inverted index of the membership lists. An AS listed several times
+        at a location counts once per record, as with pairwise counting.
+        """
         for link in self.prob:
-            if link not in self.colocated_facility:
-                self.colocated_facility[link] = 0
+            AS1, AS2 = link
+            if AS1 != AS2 and AS1 in as_locations and AS2 in as_locations:
+                locations1, locations2 = as_locations[AS1], as_locations[AS2]
+                if len(locations1) > len(locations2):
+                    locations1, locations2 = locations2, locations1
+                colocated[link] = sum(n * locations2[k] for k, n in locations1.iteritems() if k in locations2)
+            else:
+                colocated[link] = 0
 
-    def construct_attributes(self, asn_org_file, peeringdb_file):
-        self.extract_siblings(asn_org_file)
-        self.assign_triplet_rel()
-        self.compute_prev_links()
-        self.compute_prev_p2p_p2c()
-        self.assign_nonpath()
-        self.assign_vp()
-        self.assign_distance_to_tier1()
-        self.assign_colocated_ixp(peeringdb_file)
-        self.assign_colocated_facility(peeringdb_file)
+    def construct_attributes(self, asn_org_file, peeringdb, single_pass=False, workers=1, checkpoints=None):
+        """Build all link attributes; peeringdb is a PeeringDB object or a PeeringDB file name.
+
+        With several workers, builders whose inputs are ready run concurrently
+        in forked processes, see _build_in_workers. After a columnar
+        ingest_prob, the builders write into the columns it allocated.
+        With checkpoints (see checkpoint.py), the attributes of each builder
+        are checkpointed, and builders with a valid checkpoint are not run.
+        """
+        peeringdb = load_peeringdb(peeringdb)
+        # (builder, arguments, builders it needs first, attributes it sets)
+        builders = [('extract_siblings', (asn_org_file,), (), ('siblings',))]
+        if single_pass:
+            builders.append(('walk_paths', (), ('extract_siblings',),
+                             ('triplet_rel', 'triplet_counts', 'prev_links', 'vp')))
+        else:
+            builders.extend([('assign_triplet_rel', (), ('extract_siblings',), ('triplet_rel', 'triplet_counts')),
+                             ('compute_prev_links', (), (), ('prev_links',))])
+        builders.extend([('compute_prev_p2p_p2c', (), (), ('prev_p2p_p2c',)),
+                         ('assign_nonpath', (), ('walk_paths' if single_pass else 'compute_prev_links',
+                                                 'compute_prev_p2p_p2c'), ('nonpath',))])
+        if not single_pass:
+            builders.append(('assign_vp', (), (), ('vp',)))
+        builders.extend([('assign_distance_to_tier1', (), (), ('distance_to_tier1',)),
+                         ('assign_colocated_ixp', (peeringdb,), (), ('colocated_ixp',)),
+                         ('assign_colocated_facility', (peeringdb,), (), ('colocated_facility',))])
+        done = set()
+        if checkpoints is not None:
+            for name, args, requires, attributes in builders:
+                values = checkpoints.load(name)
+                if values is not None:
+                    self._merge_attributes(values)
+                    done.add(name)
+            builders = [builder for builder in builders if builder[0] not in done]
+        if workers > 1:
+            self._build_in_workers(builders, workers, checkpoints, done)
+        else:
+            for name, args, requires, attributes in builders:
+                with profiling.stage(name) as counts:
+                    getattr(self, name)(*args)
+                    values = dict((attribute, getattr(self, attribute)) for attribute in attributes)
+                    if profiling.enabled():
+                        counts.update(self._item_counts(values))
+                if checkpoints is not None:
+                    checkpoints.save(name, values)
+                self._merge_attributes(values)
+
+    def _item_counts(self, values):
+        """Sizes of the attributes of a builder, given as {attribute: value}, for profiling."""
+        counts = {'links': len(self.prob)}
+        for attribute, value in values.iteritems():
+            if attribute == 'triplet_counts':
+                counts['triplets'] = int(np.frombuffer(value, dtype=np.uint32).sum())
+            elif attribute == 'siblings':
+                counts['sibling_ases'] = len(value.org)
+            else:
+                counts[attribute] = len(value)
+        return counts
+
+    def _merge_attributes(self, values):
+        """Set the attributes of a builder, given as {attribute: value}."""
+        for attribute, value in values.iteritems():
+            if isinstance(value, LinkColumn):
+                # columns are pickled without their table
+                value.table = self.link_table
+            setattr(self, attribute, value)
+
+    def _build_in_workers(self, builders, workers, checkpoints=None, done=()):
+        """Run attribute builders in up to workers forked processes at a time.
+
+        A builder starts once the builders it requires are merged. Each worker
+        is forked from this process, so it reads the BGP paths and attributes
+        built so far without pickling them. It writes only the attributes it
+        sets to a temporary file, which is loaded and merged into this
+        instance; the queue carries just the file name. done names builders
+        whose attributes are already set. With profiling on, each builder is
+        timed, and run under cProfile if asked, inside its worker, which sends
+        back its stage record. Raises RuntimeError if a builder fails, or if
+        its worker dies without a result.
+        """
+        results = Queue()
+        pending = list(builders)
+        running = {}
+        records = {}
+        done = set(done)
+        # workers found dead without a result at the last poll
+        dead = set()
+        result_dir = tempfile.mkdtemp(prefix='problink-builders-')
+        try:
+            while pending or running:
+                for builder in list(pending):
+                    name, args, requires, attributes = builder
+                    if len(running) == workers:
+                        break
+                    if all(i in done for i in requires):
+                        pending.remove(builder)
+                        records[name] = profiling.record(name)
+                        running[name] = Process(target=_run_builder,
+                                                args=(self, name, args, attributes,
+                                                      os.path.join(result_dir, name + '.pkl'), results))
+                        running[name].start()
+                try:
+                    name, result_file, record, error = results.get(timeout=WORKER_POLL_S)
+                except Empty:
+                    # a worker that exited cleanly has its result in the queue by the next poll
+                    for name, process in running.iteritems():
+                        if not process.is_alive() and (process.exitcode != 0 or name in dead):
+                            raise RuntimeError('%s worker exited with code %d without a result'
+                                               % (name, process.exitcode))
+                        if not process.is_alive():
+                            dead.add(name)
+                    continue
+                running.pop(name).join()
+                if error is not None:
+                    raise RuntimeError('%s failed in a worker process:\n%s' % (name, error))
+                with open(result_file, 'rb') as f:
+                    values = pickle.load(f)
+                os.remove(result_file)
+                if checkpoints is not None:
+                    checkpoints.save(name, values)
+                self._merge_attributes(values)
+                records.pop(name).update(record)
+                done.add(name)
+        finally:
+            for process in running.itervalues():
+                process.terminate()
+            shutil.rmtree(result_dir, ignore_errors=True)
+
+
+def _run_builder(links, name, args, attributes, result_file, results):
+    """Worker process body: run one builder, write the attributes it sets to
+    result_file and send back its name and stage record."""
+    try:
+        stage = profiling.start(name)
+        getattr(links, name)(*args)
+        values = dict((attribute, getattr(links, attribute)) for attribute in attributes)
+        if profiling.enabled():
+            stage.record['counts'].update(links._item_counts(values))
+        stage.stop()
+        with open(result_file, 'wb') as f:
+            pickle.dump(values, f, pickle.HIGHEST_PROTOCOL)
+        results.put((name, result_file, stage.record, None))
+    except Exception:
+        results.put((name, None, None, traceback.format_exc()))
+
+
+def _chunks(items, size):
+    """Split an iterable into lists of up to size items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
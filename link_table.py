@@ -0,0 +1,290 @@
+from collections import MutableMapping
+from itertools import izip
+import numpy as np
+
+
+def asn_number(asn):
+    """The number of an ASN string, for packing.
+
+    Raises ValueError unless asn is the plain decimal form of a 32-bit ASN,
+    so that unpack_link gives back the same string.
+    """
+    try:
+        number = int(asn)
+    except ValueError:
+        number = -1
+    if not 0 <= number <= 0xffffffff or str(number) != asn:
+        raise ValueError('%r is not a 32-bit ASN.' % (asn,))
+    return number
+
+
+def pack_link(link):
+    """Pack a link (AS1, AS2) of ASN strings into one integer, AS1 << 32 | AS2."""
+    return asn_number(link[0]) << 32 | asn_number(link[1])
+
+
+def unpack_link(key):
+    """Inverse of pack_link."""
+    return (str(key >> 32), str(key & 0xffffffff))
+
+
+class LinkTable(object):
+    """Rows of directed links, packed as uint64 keys, that per-link columns are indexed by.
+
+    Rows are kept in the order the links were given in, so that columns
+    iterate like the dicts they replace. Single links are looked up in a
+    hash index of packed keys, arrays of keys by binary search in sorted_keys.
+    The links are given as (AS1, AS2) pairs, or already packed as keys.
+    """
+    def __init__(self, links=(), keys=None):
+        if keys is None:
+            keys = np.array([pack_link(link) for link in links], dtype=np.uint64)
+        self.keys = keys
+        self.sorter = np.argsort(self.keys, kind='mergesort')
+        self.sorted_keys = self.keys[self.sorter]
+        self.index = dict(izip(self.keys.tolist(), xrange(len(self.keys))))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rows(self, keys):
+        """Rows of an array of packed keys, -1 for keys that are not in the table."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        if not len(self.keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        position = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self.keys) - 1)
+        return np.where(self.sorted_keys[position] == keys, self.sorter[position], -1)
+
+    def row(self, link):
+        """Row of a link, or -1 if it is not in the table."""
+        try:
+            return self.index.get(pack_link(link), -1)
+        except (ValueError, TypeError):
+            return -1
+
+    def link(self, row):
+        return unpack_link(int(self.keys[row]))
+
+    def empty_column(self, dtype, width=None, labels=None):
+        """A LinkColumn without values, to be filled in by link or by row."""
+        values = np.zeros(len(self.keys) if width is None else (len(self.keys), width), dtype=dtype)
+        return LinkColumn(self, values, np.zeros(len(self.keys), dtype=bool), labels)
+
+
+class LinkColumn(MutableMapping):
+    """Mapping view of one attribute column of a LinkTable, keyed by (AS1, AS2) like the dict it replaces.
+
+    values holds one value (or tuple, as a row) per table row; present marks
+    the rows that have one, None meaning all rows. Links of the table can be
+    set and deleted, but links outside it cannot be added. Pickled columns
+    leave out the table, which is given back by setting table.
+    """
+    def __init__(self, table, values, present=None, labels=None):
+        self.table = table
+        self.values = values
+        self.present = present
+        self.labels = labels
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['table'] = None
+        return state
+
+    def _value(self, row):
+        value = self.values[row]
+        if self.labels is not None:
+            return self.labels[value]
+        if value.ndim:
+            return tuple(value.tolist())
+        return value.item()
+
+    def _row(self, link):
+        row = self.table.row(link)
+        if row >= 0 and self.present is not None and not self.present[row]:
+            return -1
+        return row
+
+    def rows(self):
+        """Array of the rows that have a value, in iteration order."""
+        if self.present is None:
+            return np.arange(len(self.table))
+        return np.flatnonzero(self.present)
+
+    def set_rows(self, rows, values):
+        """Set the values of an array of rows, as stored (label indexes for labelled columns)."""
+        self.values[rows] = values
+        if self.present is not None:
+            self.present[rows] = True
+
+    def clear_rows(self, rows):
+        """Drop the values of an array of rows."""
+        if self.present is None:
+            self.present = np.ones(len(self.table), dtype=bool)
+        self.present[rows] = False
+
+    def __getitem__(self, link):
+        row = self._row(link)
+        if row < 0:
+            raise KeyError(link)
+        return self._value(row)
+
+    def __setitem__(self, link, value):
+        row = self.table.row(link)
+        if row < 0:
+            raise KeyError(link)
+        self.set_rows(row, value if self.labels is None else self.labels.index(value))
+
+    def __delitem__(self, link):
+        row = self._row(link)
+        if row < 0:
+            raise KeyError(link)
+        if self.present is None:
+            self.present = np.ones(len(self.table), dtype=bool)
+        self.present[row] = False
+
+    def __contains__(self, link):
+        return self._row(link) >= 0
+
+    def __len__(self):
+        if self.present is None:
+            return len(self.table)
+        return int(self.present.sum())
+
+    def __iter__(self):
+        keys = self.table.keys[self.rows()].tolist()
+        for key in keys:
+            yield unpack_link(key)
+
+    def row_values(self, rows):
+        """List of the values of an array of rows, as the dict would hold them."""
+        if self.labels is not None:
+            return [self.labels[i] for i in self.values[rows].tolist()]
+        if self.values.ndim > 1:
+            return map(tuple, self.values[rows].tolist())
+        return self.values[rows].tolist()
+
+    def lookup(self, rows):
+        """Which of an array of table rows (-1 for no row) have a value.
+
+        Returns the positions in rows that do, and their values.
+        """
+        found = rows >= 0
+        if self.present is not None:
+            found[found] = self.present[rows[found]]
+        positions = np.flatnonzero(found)
+        return positions, self.row_values(rows[positions])
+
+    def iteritems(self):
+        rows = self.rows()
+        keys = self.table.keys[rows].tolist()
+        for key, value in izip(keys, self.row_values(rows)):
+            yield unpack_link(key), value
+
+
+class PairCounts(object):
+    """Counts of (row, value) pairs of integers below 2**32, such as the paths behind each
+    (link row, vantage point) pair.
+
+    Pairs are kept packed as row << 32 | value, sorted, with their counts.
+    Pairs that are already merged are counted in place; others are buffered
+    and merged in once they outgrow the merged pairs, so memory stays
+    proportional to the distinct pairs, and a few updates of a large set
+    (e.g. a memory-mapped saved one) only touch what they count.
+    """
+    def __init__(self, pairs=None, counts=None):
+        self.pairs = np.zeros(0, dtype=np.int64) if pairs is None else pairs
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else counts
+        self.added = []
+        self.added_size = 0
+
+    def _find(self, pairs):
+        """Positions of packed pairs among the merged ones, -1 for pairs that are not merged."""
+        position = np.searchsorted(self.pairs, pairs)
+        found = position < len(self.pairs)
+        found[found] = self.pairs[position[found]] == pairs[found]
+        return np.where(found, position, -1)
+
+    def add(self, rows, values, weight=1):
+        """Count each (rows[i], values[i]) pair weight more times."""
+        pairs, counts = np.unique(np.asarray(rows, dtype=np.int64) << 32 | values, return_counts=True)
+        position = self._find(pairs)
+        merged = position >= 0
+        self.counts[position[merged]] += weight * counts[merged]
+        if not merged.all():
+            self.added.append((pairs[~merged], weight * counts[~merged]))
+            self.added_size += len(self.added[-1][0])
+            if self.added_size > max(len(self.pairs), 1 << 18):
+                self._merge()
+
+    def _added(self):
+        """The buffered pairs, sorted and unique, with their summed counts."""
+        buffered, weights = zip(*self.added)
+        pairs, inverse = np.unique(np.concatenate(buffered), return_inverse=True)
+        return pairs, np.bincount(inverse, weights=np.concatenate(weights)).astype(np.int64)
+
+    def _merge(self):
+        if self.added:
+            pairs, counts = self._added()
+            self.pairs = np.concatenate((self.pairs, pairs))
+            self.counts = np.concatenate((self.counts, counts))
+            order = np.argsort(self.pairs, kind='mergesort')
+            self.pairs, self.counts = self.pairs[order], self.counts[order]
+            self.added = []
+            self.added_size = 0
+
+    def count(self, rows, values):
+        """Counts of an array of pairs."""
+        pairs = np.asarray(rows, dtype=np.int64) << 32 | values
+        position = self._find(pairs)
+        counts = np.zeros(len(pairs), dtype=np.int64)
+        counts[position >= 0] = self.counts[position[position >= 0]]
+        if self.added:
+            added, added_counts = self._added()
+            position = np.searchsorted(added, pairs)
+            found = position < len(added)
+            found[found] = added[position[found]] == pairs[found]
+            counts[found] += added_counts[position[found]]
+        return counts
+
+    def values(self, row):
+        """Sorted array of the values with a nonzero count with a row."""
+        first, last = np.searchsorted(self.pairs, [row << 32, (row + 1) << 32])
+        values = self.pairs[first:last][self.counts[first:last] != 0] & 0xffffffff
+        if self.added:
+            added, counts = self._added()
+            first, last = np.searchsorted(added, [row << 32, (row + 1) << 32])
+            values = np.union1d(values, added[first:last][counts[first:last] != 0] & 0xffffffff)
+        return values
+
+    def distinct(self, rows):
+        """How many values have a nonzero count with each of an array of rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        nonzero = np.concatenate(([0], np.cumsum(self.counts != 0)))
+        distinct = nonzero[np.searchsorted(self.pairs, (rows + 1) << 32)] - \
+            nonzero[np.searchsorted(self.pairs, rows << 32)]
+        if self.added:
+            # buffered pairs are never merged ones
+            added, added_counts = self._added()
+            added_rows = added[added_counts != 0] >> 32
+            distinct += np.searchsorted(added_rows, rows, 'right') - np.searchsorted(added_rows, rows, 'left')
+        return distinct
+
+    def __len__(self):
+        self._merge()
+        return int(np.count_nonzero(self.counts))
+
+    def arrays(self):
+        """The rows, values and counts of the pairs with a nonzero count, sorted by row, then value."""
+        self._merge()
+        pairs, counts = self.pairs, self.counts
+        if not counts.all():
+            pairs, counts = pairs[counts != 0], counts[counts != 0]
+        return pairs >> 32, pairs & 0xffffffff, counts
+
+    def __eq__(self, other):
+        if not isinstance(other, PairCounts):
+            return False
+        return all(np.array_equal(a, b) for a, b in zip(self.arrays(), other.arrays()))
+
+    def __ne__(self, other):
+        return not self == other
@@ -0,0 +1,101 @@
+import math
+import struct
+import json
+import numpy as np
+from feature import FEATURE_TABLES
+
+MODEL_MAGIC = b'PLMD'
+MODEL_VERSION = 1
+
+
+class ProblinkModel(object):
+    """A trained ProbLink model: class prior and feature likelihood tables.
+
+    Has the same *_feature tables as ProblinkFeatures, as plain dicts, so it can
+    stand in for one when scoring. class_prior is P(C) for (p2p, p2c, c2p);
+    log_tables maps a table name to ({feature value: row}, log10 likelihood
+    matrix), the rows being in table iteration order.
+    """
+    def __init__(self, class_prior, tables, log_class_prior=None, log_tables=None):
+        self.class_prior = list(class_prior)
+        for name in FEATURE_TABLES:
+            setattr(self, name, tables[name])
+        if log_class_prior is None:
+            log_class_prior = [math.log10(x) for x in self.class_prior]
+        self.log_class_prior = log_class_prior
+        if log_tables is None:
+            log_tables = {}
+            for name in FEATURE_TABLES:
+                table = getattr(self, name)
+                values = list(table)
+                log_tables[name] = (dict((v, i) for i, v in enumerate(values)),
+                                    np.array([[math.log10(x) for x in table[v]] for v in values],
+                                             dtype=np.float64).reshape(-1, 3))
+        self.log_tables = log_tables
+
+    @classmethod
+    def from_features(cls, class_prior, features):
+        """Model of the feature likelihoods of a ProblinkFeatures and a class prior."""
+        return cls(class_prior, dict(zip(FEATURE_TABLES, features.tables())))
+
+    def tables(self):
+        """The feature likelihood tables in FEATURE_TABLES order, as ProblinkFeatures.tables() gives them."""
+        return tuple(dict((v, list(likelihood)) for v, likelihood in getattr(self, name).iteritems())
+                     for name in FEATURE_TABLES)
+
+    def save(self, filename):
+        """Write the model to a binary file.
+
+        Layout: magic, version, header length, JSON header (the feature values of
+        each table), then the class prior and its log10 (float64), followed by the
+        likelihood and log10 likelihood matrices (float64, 3 columns) of each
+        table in FEATURE_TABLES order.
+        """
+        header = {'tables': []}
+        arrays = [np.array(self.class_prior, dtype=np.float64),
+                  np.array(self.log_class_prior, dtype=np.float64)]
+        for name in FEATURE_TABLES:
+            table = getattr(self, name)
+            index, log_table = self.log_tables[name]
+            values = sorted(index, key=index.get)
+            header['tables'].append([name, values])
+            arrays.append(np.array([table[v] for v in values], dtype=np.float64).reshape(-1, 3))
+            arrays.append(log_table)
+        blob = json.dumps(header).encode('utf-8')
+        blob += b' ' * (-(len(blob) + 12) % 8)
+        with open(filename, 'wb') as f:
+            f.write(MODEL_MAGIC + struct.pack('<II', MODEL_VERSION, len(blob)))
+            f.write(blob)
+            for arr in arrays:
+                f.write(np.ascontiguousarray(arr, dtype='<f8').tobytes())
+
+    @classmethod
+    def load(cls, filename):
+        """Read a file written by save()."""
+        with open(filename, 'rb') as f:
+            magic, version, length = struct.unpack('<4sII', f.read(12))
+            if magic != MODEL_MAGIC or version != MODEL_VERSION:
+                raise ValueError('%s is not a ProbLink model file of version %d.' % (filename, MODEL_VERSION))
+            header = json.loads(f.read(length).decode('utf-8'))
+            data = np.frombuffer(f.read(), dtype='<f8').astype(np.float64)
+        class_prior, log_class_prior = data[0:3].tolist(), data[3:6].tolist()
+        offset = 6
+        tables, log_tables = {}, {}
+        for name, values in header['tables']:
+            values = [_feature_value(v) for v in values]
+            size = 3 * len(values)
+            likelihood = data[offset:offset + size].reshape(-1, 3)
+            log_table = data[offset + size:offset + 2 * size].reshape(-1, 3)
+            offset += 2 * size
+            tables[name] = dict(zip(values, likelihood.tolist()))
+            log_tables[name] = (dict((v, i) for i, v in enumerate(values)), log_table)
+        return cls(class_prior, tables, log_class_prior, log_tables)
+
+
+def _feature_value(value):
+    """Undo the JSON encoding of a feature value: lists back to tuples, unicode back to str."""
+    if isinstance(value, list):
+        return tuple(_feature_value(v) for v in value)
+    if isinstance(value, unicode):
+        return str(value)
+    return value
@@ -0,0 +1,251 @@
+from array import array
+import numpy as np
+import os
+import struct
+import json
+
+CACHE_MAGIC = b'PLPS'
+CACHE_VERSION = 1
+# paths buffered before add() first drops duplicates
+COMPACT_MIN_PATHS = 1 << 20
+# multiplier of path_hashes, the 64-bit FNV prime
+PATH_HASH_BASE = 0x100000001b3
+
+
+class PathStore(object):
+    """Compact store of deduplicated BGP paths.
+
+    ASNs are interned to dense uint32 ids and paths are kept CSR-style:
+    path i is asn_ids[offsets[i]:offsets[i+1]]. Reverse paths are not stored,
+    they are produced on demand while iterating.
+
+    Duplicates are not looked up as paths are added; they are dropped by
+    sorting the packed paths, whenever the buffers have doubled since the
+    last time and on freeze(), keeping the first copy of each path.
+    """
+
+    def __init__(self):
+        self.asn_id = {}
+        self.asn_names = []
+        self.offsets = array('L', [0])
+        self.asn_ids = array('I')
+        # reverse_dup[i] is set if the reverse of path i is also a stored path
+        self.reverse_dup = None
+        self._compact_at = COMPACT_MIN_PATHS
+        self.frozen = False
+
+    def __len__(self):
+        if not self.frozen:
+            self._compact()
+        return len(self.offsets) - 1
+
+    def add(self, asn_list):
+        """Add a path given as a list of ASN strings, ignoring duplicates."""
+        if self.frozen:
+            raise ValueError('cannot add paths to a frozen PathStore.')
+        ids = []
+        for asn in asn_list:
+            i = self.asn_id.get(asn)
+            if i is None:
+                i = len(self.asn_names)
+                self.asn_id[asn] = i
+                self.asn_names.append(asn)
+            ids.append(i)
+        self.asn_ids.extend(ids)
+        self.offsets.append(len(self.asn_ids))
+        if len(self.offsets) > self._compact_at:
+            self._compact()
+            self._compact_at = max(COMPACT_MIN_PATHS, 2 * len(self.offsets))
+
+    def _compact(self):
+        """Drop duplicate paths from the build buffers."""
+        offsets, asn_ids = self._buffers()
+        keep = unique_paths(offsets, asn_ids)
+        if keep.all():
+            return
+        lengths = np.diff(offsets)[keep]
+        asn_ids = asn_ids[np.repeat(keep, np.diff(offsets))]
+        self.offsets = array(self.offsets.typecode, np.concatenate(([0], np.cumsum(lengths))).astype(
+            self.offsets.typecode).tobytes())
+        self.asn_ids = array('I', asn_ids.tobytes())
+
+    def _buffers(self):
+        """The build buffers as int64 offsets and uint32 ASN id arrays."""
+        return (np.frombuffer(self.offsets, dtype=self.offsets.typecode).astype(np.int64),
+                np.frombuffer(self.asn_ids, dtype=np.uint32))
+
+    def freeze(self):
+        """Drop duplicate paths and convert the build buffers into NumPy arrays."""
+        if self.frozen:
+            return
+        self._compact()
+        offsets, asn_ids = self._buffers()
+        self.offsets, self.asn_ids = offsets, asn_ids.copy()
+        self.reverse_dup = reverse_stored(self.offsets, self.asn_ids)
+        self.frozen = True
+
+    def _iter_ids(self, block_size=65536):
+        """Yield the id list of every path, slicing the flat array block by block."""
+        for first in xrange(0, len(self), block_size):
+            last = min(first + block_size, len(self))
+            offsets = self.offsets[first:last+1].tolist()
+            base = offsets[0]
+            block = self.asn_ids[base:offsets[-1]].tolist()
+            for i in xrange(len(offsets) - 1):
+                yield block[offsets[i] - base:offsets[i+1] - base]
+
+    def iter_forward(self):
+        """Yield every stored path as a list of ASN strings."""
+        names = self.asn_names
+        for ids in self._iter_ids():
+            yield [names[i] for i in ids]
+
+    def iter_reverse(self):
+        """Yield the reverse of every stored path as a list of ASN strings."""
+        names = self.asn_names
+        for ids in self._iter_ids():
+            yield [names[i] for i in reversed(ids)]
+
+    def iter_union(self):
+        """Yield the union of forward and reverse paths, each path once."""
+        for path in self.iter_forward():
+            yield path
+        names = self.asn_names
+        reverse_dup = self._reverse_dup_list()
+        for i, ids in enumerate(self._iter_ids()):
+            if not reverse_dup[i]:
+                yield [names[j] for j in reversed(ids)]
+
+    def iter_with_reverse(self):
+        """Yield (path, reverse_new) pairs, reverse_new being set if the reverse of the path is not stored."""
+        names = self.asn_names
+        reverse_dup = self._reverse_dup_list()
+        for i, ids in enumerate(self._iter_ids()):
+            yield [names[j] for j in ids], not reverse_dup[i]
+
+    def _reverse_dup_list(self):
+        if self.reverse_dup is None:
+            self._compact()
+            return reverse_stored(*self._buffers()).tolist()
+        return self.reverse_dup.tolist()
+
+    def save(self, filename, header=None):
+        """Write the frozen store to a binary file that load() can memory-map.
+
+        Layout: magic, version, header length, JSON header (sizes, ASN names and
+        any caller-supplied fields), then the offsets (int64), ASN id (uint32)
+        and reverse_dup (bool) arrays, each aligned to 8 bytes. The file is
+        written under a temporary name and renamed, so it is never left half written.
+        """
+        self.freeze()
+        header = dict(header or {})
+        header['n_paths'] = len(self)
+        header['n_asn_ids'] = len(self.asn_ids)
+        header['asn_names'] = self.asn_names
+        blob = json.dumps(header).encode('utf-8')
+        blob += b' ' * (-(len(blob) + 12) % 8)
+        tmp_file = filename + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(CACHE_MAGIC + struct.pack('<II', CACHE_VERSION, len(blob)))
+            f.write(blob)
+            for arr in (self.offsets, self.asn_ids, self.reverse_dup):
+                f.write(np.ascontiguousarray(arr).tobytes())
+                f.write(b'\0' * (-arr.nbytes % 8))
+        os.rename(tmp_file, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Memory-map a file written by save(). Returns (store, header).
+
+        Raises ValueError if the file is not a complete cache file of this version.
+        """
+        with open(filename, 'rb') as f:
+            magic, version, length = struct.unpack('<4sII', f.read(12))
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                raise ValueError('%s is not a PathStore cache file of version %d.' % (filename, CACHE_VERSION))
+            header = json.loads(f.read(length).decode('utf-8'))
+        store = cls()
+        store.asn_names = [str(asn) for asn in header.pop('asn_names')]
+        store.asn_id = dict((asn, i) for i, asn in enumerate(store.asn_names))
+        n_paths, n_asn_ids = header['n_paths'], header['n_asn_ids']
+        offset = 12 + length
+        size = offset + sum(n * itemsize + (-n * itemsize % 8)
+                            for n, itemsize in ((n_paths + 1, 8), (n_asn_ids, 4), (n_paths, 1)))
+        if os.path.getsize(filename) < size:
+            raise ValueError('%s is truncated.' % filename)
+        arrays = []
+        for dtype, size in ((np.int64, n_paths + 1), (np.uint32, n_asn_ids), (np.bool_, n_paths)):
+            nbytes = size * np.dtype(dtype).itemsize
+            if size:
+                arrays.append(np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(size,)))
+            else:
+                arrays.append(np.zeros(0, dtype=dtype))
+            offset += nbytes + (-nbytes % 8)
+        store.offsets, store.asn_ids, store.reverse_dup = arrays
+        store.frozen = True
+        return store, header
+
+
+def _length_groups(offsets, asn_ids):
+    """Yield (path numbers, 2-d array of their ASN ids) for each path length."""
+    lengths = np.diff(offsets)
+    for length in np.unique(lengths):
+        paths = np.flatnonzero(lengths == length)
+        yield paths, asn_ids[offsets[paths][:, None] + np.arange(length)]
+
+
+def _sorted_rows(rows):
+    """Order of the rows of a 2-d array that puts equal rows next to each other,
+    and a mask of the sorted rows that equal the row before them."""
+    if not rows.shape[1]:
+        order = np.arange(len(rows))
+        return order, order > 0
+    order = np.lexsort(rows.T[::-1])
+    rows = rows[order]
+    same = np.zeros(len(rows), dtype=np.bool_)
+    same[1:] = (rows[1:] == rows[:-1]).all(axis=1)
+    return order, same
+
+
+def unique_paths(offsets, asn_ids):
+    """Mask of the first copy of every distinct path of a CSR path array."""
+    keep = np.zeros(len(offsets) - 1, dtype=np.bool_)
+    for paths, rows in _length_groups(offsets, asn_ids):
+        # lexsort is stable, so the first of equal rows is the first copy
+        order, same = _sorted_rows(rows)
+        keep[paths[order[~same]]] = True
+    return keep
+
+
+def reverse_stored(offsets, asn_ids):
+    """Mask of the paths of a CSR array of distinct paths whose reverse is also in it."""
+    stored = np.zeros(len(offsets) - 1, dtype=np.bool_)
+    for paths, rows in _length_groups(offsets, asn_ids):
+        # forward rows, then reversed rows: a reversed row equals at most one forward row
+        order, same = _sorted_rows(np.vstack((rows, rows[:, ::-1])))
+        pairs = np.flatnonzero(same)
+        for reverse in (order[pairs], order[pairs - 1]):
+            reverse = reverse[reverse >= len(paths)]
+            stored[paths[reverse - len(paths)]] = True
+    return stored
+
+
+def path_hashes(offsets, asn_ids):
+    """64-bit hash of every path of a CSR path array, folding its ASN ids in order;
+    path_hash gives the same hash for one path."""
+    hashes = np.zeros(len(offsets) - 1, dtype=np.uint64)
+    for paths, rows in _length_groups(offsets, asn_ids):
+        h = np.zeros(len(paths), dtype=np.uint64)
+        for column in rows.T:
+            # uint64 arithmetic wraps
+            h = h * np.uint64(PATH_HASH_BASE) + column.astype(np.uint64) + np.uint64(1)
+        hashes[paths] = h
+    return hashes
+
+
+def path_hash(ids):
+    """path_hashes of one path, given as a list of ASN ids."""
+    h = 0
+    for i in ids:
+        h = (h * PATH_HASH_BASE + i + 1) & 0xffffffffffffffff
+    return h
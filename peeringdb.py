@@ -0,0 +1,54 @@
+import json
+import sqlite3
+from collections import defaultdict
+from fileio import open_input, strip_compression_suffix
+
+
+class PeeringDB(object):
+    """PeeringDB dump parsed once into the indexes ProbLink needs.
+
+    route_servers is the set of route server ASNs; as_ixps and as_facilities
+    map an ASN to {ixlan/facility id: number of membership records}.
+    ASNs are strings, as in BGP paths.
+    """
+    def __init__(self, peeringdb_file):
+        self.peeringdb_file = peeringdb_file
+        self.route_servers = set()
+        self.as_ixps = defaultdict(dict)
+        self.as_facilities = defaultdict(dict)
+
+        # PeeringDB json dump
+        if strip_compression_suffix(peeringdb_file).endswith('json'):
+            with open_input(peeringdb_file) as f:
+                data = json.load(f)
+            networks = ((i['asn'], i['info_type']) for i in data['net']['data'])
+            ixlans = ((i['asn'], i['ixlan_id']) for i in data['netixlan']['data'])
+            facilities = ((i['local_asn'], i['fac_id']) for i in data['netfac']['data'])
+            self._index(networks, ixlans, facilities)
+        # PeeringDB sqlite dump
+        elif peeringdb_file.endswith('sqlite'):
+            conn = sqlite3.connect(peeringdb_file)
+            self._index(conn.execute("SELECT asn, info_type FROM 'peeringdb_network'"),
+                        conn.execute("SELECT asn, ixlan_id FROM 'peeringdb_network_ixlan'"),
+                        conn.execute("SELECT local_asn, fac_id FROM 'peeringdb_network_facility'"))
+            conn.close()
+        else:
+            raise TypeError('PeeringDB file must be either a json file or a sqlite file.')
+
+    def _index(self, networks, ixlans, facilities):
+        for asn, info_type in networks:
+            if info_type == 'Route Server':
+                self.route_servers.add(str(asn))
+        for asn, ixp in ixlans:
+            memberships = self.as_ixps[str(asn)]
+            memberships[ixp] = memberships.get(ixp, 0) + 1
+        for asn, facility in facilities:
+            memberships = self.as_facilities[str(asn)]
+            memberships[facility] = memberships.get(facility, 0) + 1
+
+
+def load_peeringdb(peeringdb):
+    """Return peeringdb itself if it is already a PeeringDB, else parse the named file."""
+    if isinstance(peeringdb, PeeringDB):
+        return peeringdb
+    return PeeringDB(peeringdb)
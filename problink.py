@@ -1,8 +1,23 @@
 import argparse
 from link import Links
-from bgp_path_parser import BgpPaths
-from feature import ProblinkFeatures
+from bgp_path_parser import BgpPaths, fingerprint
+from feature import ProblinkFeatures, FEATURE_TABLES
+from peeringdb import PeeringDB
+from link import TRIPLET_RELS
+from link_table import LinkColumn, pack_link
+from model import ProblinkModel
+from checkpoint import Checkpoints
+from itertools import izip
+from multiprocessing import Process
+import numpy as np
 import math
+import os
+import shutil
+import time
+import delta
+import profiling
+
+TIER1S = ['174', '209', '286', '701', '1239', '1299', '2828', '2914', '3257', '3320', '3356', '4436', '5511', '6453', '6461', '6762', '7018', '12956', '3549']
 
 
 def compute_class_prior(links):
@@ -25,7 +40,7 @@ def naive_bayes(links, features):
     inferred_link = set()
     class_prior = compute_class_prior(links)
     log_class_prior = map(lambda x: math.log10(x), class_prior)
-    tier1s = ['174', '209', '286', '701', '1239', '1299', '2828', '2914', '3257', '3320', '3356', '4436', '5511', '6453', '6461', '6762', '7018', '12956', '3549']
+    tier1s = TIER1S
 
     for link in links.prob:
         AS1, AS2 = link
@@ -48,9 +63,9 @@ def naive_bayes(links, features):
         triplet_num = 0
         # triplet feature
         if link in links.triplet_rel:
-            triplet_num += len(links.triplet_rel[link])
-            for adjacent_links_rel in links.triplet_rel[link]:
-                log_prob = map(lambda x, y: x + y, log_prob, map(lambda x: math.log10(x), features.triplet_feature[adjacent_links_rel]))
+            for adjacent_links_rel, n in links.triplet_histogram(link):
+                triplet_num += n
+                log_prob = map(lambda x, y: x + n * y, log_prob, map(lambda x: math.log10(x), features.triplet_feature[adjacent_links_rel]))
 
         # non-path feature
         if link in links.nonpath:
@@ -92,6 +107,328 @@ def naive_bayes(links, features):
         inferred_link.add(reverse_link)
 
 
+def log_likelihood_table(feature_likelihood, reverse=False):
+    """Return ({feature value: row}, log10 likelihood matrix) for a feature likelihood table.
+
+    With reverse=True the p2c and c2p columns are swapped, which gives the
+    likelihoods of the reverse link.
+    """
+    values = list(feature_likelihood)
+    table = []
+    for v in values:
+        p2p, p2c, c2p = feature_likelihood[v]
+        if reverse:
+            p2c, c2p = c2p, p2c
+        table.append([math.log10(p2p), math.log10(p2c), math.log10(c2p)])
+    return dict((v, i) for i, v in enumerate(values)), np.array(table, dtype=np.float64).reshape(-1, 3)
+
+
+def log_likelihood_tables(features):
+    """Precompute the log likelihood tables used by batch_log_prob, in scoring order.
+
+    features is a ProblinkFeatures, or a ProblinkModel whose log tables are used as saved.
+    """
+    def table(name, reverse=False):
+        if isinstance(features, ProblinkModel):
+            index, log_table = features.log_tables[name]
+            return index, log_table[:, [0, 2, 1]] if reverse else log_table
+        return log_likelihood_table(getattr(features, name), reverse)
+
+    triplet_log = np.zeros((len(TRIPLET_RELS), 3))
+    index, log_table = table('triplet_feature')
+    for i, rels in enumerate(TRIPLET_RELS):
+        if rels in index:
+            triplet_log[i] = log_table[index[rels]]
+    # (link attribute, log table, whether the attribute of the reverse link is used)
+    tables = [('nonpath', table('nonpath_feature'), False),
+              ('nonpath', table('nonpath_feature', True), True),
+              ('distance_to_tier1', table('distance_to_tier1_feature'), False),
+              ('vp', table('vp_feature'), False),
+              ('vp', table('vp_feature', True), True),
+              ('colocated_ixp', table('colocated_ixp_feature'), False),
+              ('colocated_facility', table('colocated_facility_feature'), False)]
+    return triplet_log, tables
+
+
+def scoring_prior(links, features):
+    """log10 P(C): the saved prior of a ProblinkModel, else the prior of the current link types."""
+    if isinstance(features, ProblinkModel):
+        return features.log_class_prior
+    return map(lambda x: math.log10(x), compute_class_prior(links))
+
+
+def batch_log_prob(links, batch, log_class_prior, log_tables):
+    """Score a list of links at once: a (len(batch), 3) matrix of log10 P(C) + sum log10 P(f|C).
+
+    Applies the same operations in the same order as naive_bayes, one array
+    operation per feature instead of one per link.
+    """
+    triplet_log, tables = log_tables
+    log_prob = np.empty((len(batch), 3))
+    log_prob[:] = log_class_prior
+    table_rows = {}
+    if links.link_table is not None:
+        table_rows[False] = links.link_table.rows([pack_link(link) for link in batch])
+        table_rows[True] = links.link_table.rows([pack_link((AS2, AS1)) for AS1, AS2 in batch])
+
+    # triplet feature, weighted by the triplet histogram
+    width = len(TRIPLET_RELS)
+    rows, triplet_rows = _feature_lookup(links.triplet_rel, batch, table_rows.get(False))
+    counts = np.zeros((len(batch), width))
+    counts[rows] = np.frombuffer(links.triplet_counts, dtype=np.uint32).reshape(-1, width)[triplet_rows]
+    for i in range(width):
+        log_prob += counts[:, i:i+1] * triplet_log[i]
+    triplet_num = counts.sum(axis=1)[:, None]
+
+    # the other features are weighted by the number of triplets
+    for attribute, (index, table), reverse in tables:
+        keys = [(AS2, AS1) for AS1, AS2 in batch] if reverse else batch
+        rows, values = _feature_lookup(getattr(links, attribute), keys, table_rows.get(reverse))
+        # values missing from a saved model's tables are skipped, like missing attributes
+        rows, codes = [i for i, v in izip(rows, values) if v in index], [index[v] for v in values if v in index]
+        log_prob[rows] += triplet_num[rows] * table[codes]
+    return log_prob
+
+
+def _feature_lookup(link_feature, batch, table_rows=None):
+    """Positions in batch of the links that have a value in link_feature, and those values.
+
+    table_rows, the LinkTable rows of the batch, lets a LinkColumn answer
+    for the whole batch at once.
+    """
+    if table_rows is not None and isinstance(link_feature, LinkColumn):
+        return link_feature.lookup(table_rows)
+    rows, values = [], []
+    for i, link in enumerate(batch):
+        if link in link_feature:
+            rows.append(i)
+            values.append(link_feature[link])
+    return rows, values
+
+
+def decide(log_prob):
+    """Pick each link's type from its scores: 0 p2p, 1 p2c, 2 c2p, -1 if there is no strict maximum."""
+    log_p2p, log_p2c, log_c2p = log_prob[:, 0], log_prob[:, 1], log_prob[:, 2]
+    decision = np.full(len(log_prob), -1, dtype=np.int8)
+    decision[(log_p2p > log_p2c) & (log_p2p > log_c2p)] = 0
+    decision[(log_p2c > log_p2p) & (log_p2c > log_c2p)] = 1
+    decision[(log_c2p > log_p2p) & (log_c2p > log_p2c)] = 2
+    return decision
+
+
+def scoring_order(links, decisions=None, affected=None):
+    """Walk links in naive_bayes order to find Tier-1 and sibling links and the links to score.
+
+    Returns (order, batch): order lists (link, rel) in output order, rel being
+    '0' or '1' for Tier-1 and sibling links, a previous decision for links
+    that need no re-scoring (see infer_relationships) and None for the links
+    to score, which are also listed in batch.
+    """
+    inferred_link = set()
+    order = []
+    batch = []
+    for link in links.prob:
+        AS1, AS2 = link
+        if AS1 in TIER1S and AS2 in TIER1S:
+            order.append((link, '0'))
+            continue
+        reverse_link = (AS2, AS1)
+        if link in inferred_link:
+            continue
+        if link in links.siblings:
+            order.append((link, '1'))
+        elif affected is not None and link in decisions and \
+                link not in affected and reverse_link not in affected:
+            order.append((link, decisions[link]))
+        else:
+            order.append((link, None))
+            batch.append(link)
+        inferred_link.add(link)
+        inferred_link.add(reverse_link)
+    return order, batch
+
+
+def relationship_records(order, decision):
+    """Turn a scoring order and the decide() values of its links to score into (AS1, AS2, rel) records."""
+    records = []
+    scored = 0
+    for link, rel in order:
+        AS1, AS2 = link
+        if rel is None or isinstance(rel, int):
+            if rel is None:
+                rel = decision[scored]
+                scored += 1
+            if rel == 0:
+                records.append((AS1, AS2, '0'))
+            elif rel == 1:
+                records.append((AS1, AS2, '-1'))
+            elif rel == 2:
+                records.append((AS2, AS1, '-1'))
+        else:
+            records.append((AS1, AS2, rel))
+    return records
+
+
+def infer_relationships(links, features, decisions=None, affected=None):
+    """Do inference using naive bayes algorithm, scoring all links in one batch.
+
+    Returns the inferred (AS1, AS2, rel) records in naive_bayes output order,
+    rel being '0' (p2p, or Tier-1 link), '-1' (AS1 is the provider of AS2)
+    or '1' (siblings).
+
+    If decisions is given it is filled with the decide() value of every scored
+    link. With affected as well, decisions holds those of a previous run with
+    the same feature tables, and only links that are in affected, in either
+    direction, are scored again.
+    """
+    order, batch = scoring_order(links, decisions, affected)
+    decision = decide(batch_log_prob(links, batch, scoring_prior(links, features), log_likelihood_tables(features))).tolist()
+    if decisions is not None:
+        decisions.update(zip(batch, decision))
+    return relationship_records(order, decision)
+
+
+def write_relationships(records, output_file='problink_result.txt'):
+    output_rel = open(output_file, 'w')
+    for record in records:
+        output_rel.write('|'.join(record) + '\n')
+    output_rel.close()
+
+
+def naive_bayes_batched(links, features):
+    """Batched equivalent of naive_bayes, with the same output in the same order."""
+    write_relationships(infer_relationships(links, features))
+
+
+def _score_shard(links, order, log_class_prior, log_tables, part_file):
+    """Worker process body: score the links of one contiguous slice of the scoring order."""
+    batch = [link for link, rel in order if rel is None]
+    decision = decide(batch_log_prob(links, batch, log_class_prior, log_tables)).tolist()
+    write_relationships(relationship_records(order, decision), part_file)
+
+
+def naive_bayes_sharded(links, features, workers):
+    """Equivalent of naive_bayes_batched that scores links in worker processes.
+
+    The scoring order is cut into workers contiguous shards. Each worker is
+    forked after the likelihood tables are built, so it reads them and the link
+    attributes without copying, and writes the records of its shard to a part
+    file. The parts are concatenated in shard order into problink_result.txt.
+    """
+    order, batch = scoring_order(links)
+    log_prior = scoring_prior(links, features)
+    log_tables = log_likelihood_tables(features)
+    size = (len(order) + workers - 1) // workers
+    shards = []
+    for i in range(workers):
+        part_file = 'problink_result.txt.part%d' % i
+        process = Process(target=_score_shard,
+                          args=(links, order[i*size:(i+1)*size], log_prior, log_tables, part_file))
+        process.start()
+        shards.append((process, part_file))
+    try:
+        for process, part_file in shards:
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError('scoring worker for %s exited with code %d' % (part_file, process.exitcode))
+        with open('problink_result.txt', 'w') as output_rel:
+            for process, part_file in shards:
+                with open(part_file) as f:
+                    shutil.copyfileobj(f, output_rel)
+    finally:
+        for process, part_file in shards:
+            if process.is_alive():
+                process.terminate()
+            if os.path.exists(part_file):
+                os.remove(part_file)
+
+
+def update_link_types(links, records):
+    """Make inferred p2p and p2c relationships the new deterministic link types.
+
+    Sibling links keep their types. Returns the set of links whose type changed.
+    """
+    changed = set()
+    for AS1, AS2, rel in records:
+        if rel == '0':
+            updates = (((AS1, AS2), (1.0, 0.0, 0.0), 'p2p'), ((AS2, AS1), (1.0, 0.0, 0.0), 'p2p'))
+        elif rel == '-1':
+            updates = (((AS1, AS2), (0.0, 1.0, 0.0), 'p2c'), ((AS2, AS1), (0.0, 0.0, 1.0), 'c2p'))
+        else:
+            continue
+        for link, prob, link_rel in updates:
+            if links.rel.get(link) != link_rel:
+                changed.add(link)
+            links.prob[link] = prob
+            links.rel[link] = link_rel
+    return changed
+
+
+def iterative_inference(links, features, max_iterations, tolerance=0.0):
+    """Repeat inference, feeding inferred link types back, until they converge.
+
+    Stops once the fraction of links whose type changed in a round is at most
+    tolerance, or after max_iterations rounds. Between rounds only the
+    attributes that depend on link types and the feature tables are rebuilt.
+    Returns the records of the last round.
+    """
+    for iteration in range(1, max_iterations + 1):
+        start = time.time()
+        records = infer_relationships(links, features)
+        changed = update_link_types(links, records)
+        fraction = len(changed) / float(max(len(links.prob), 1))
+        print('Iteration %d: %d links changed type (%.4f%%), %.2fs' % (iteration, len(changed), 100 * fraction, time.time() - start))
+        if fraction <= tolerance:
+            print('Converged after %d iterations' % iteration)
+            break
+        if iteration < max_iterations:
+            start = time.time()
+            links.recompute_type_attributes()
+            features = ProblinkFeatures(links)
+            features.compute_feature_likelihoods()
+            print('Iteration %d: attributes and feature likelihoods recomputed, %.2fs' % (iteration, time.time() - start))
+    else:
+        print('Stopped after %d iterations without converging' % max_iterations)
+    return records
+
+
+def delta_inference(state_dir, key, as_org_file, added_file, withdrawn_file, save_state_dir=None,
+                    approximate=False):
+    """Update the results of the run that saved state_dir with added and withdrawn paths.
+
+    Only the attributes of links on the changed paths are updated. The feature
+    likelihoods are then recomputed, and all links are scored again if they
+    changed, else only the links on the changed paths, which writes the same
+    problink_result.txt as a full run on the new paths. With approximate, the
+    likelihoods saved with the state are kept and only the links on the
+    changed paths are scored again, which can differ from a full run.
+    """
+    links, model, decisions = delta.load_state(state_dir, key, as_org_file)
+    print('State loaded from %s...' % state_dir)
+    paths = links.bgp_paths.forward_paths
+    ixp = links.bgp_paths.ixp
+    added = delta.read_paths(added_file, ixp) if added_file else []
+    withdrawn = delta.read_paths(withdrawn_file, ixp) if withdrawn_file else []
+    added, withdrawn = delta.net_path_delta(paths, added, withdrawn)
+    affected = links.apply_path_delta(added, withdrawn)
+    print('Path delta applied, %d links affected...' % len(affected))
+    if not approximate:
+        features = ProblinkFeatures(links)
+        features.compute_feature_likelihoods()
+        print('Feature likelihoods computed...')
+        # the feature tables are shared by all links, so any change to them means a full re-score
+        if [dict((v, list(likelihood)) for v, likelihood in table.iteritems())
+                for table in features.tables()] != list(model.tables()):
+            print('Feature likelihoods changed, re-scoring all links...')
+            affected = None
+        model = ProblinkModel.from_features(model.class_prior, features)
+    else:
+        print('Scoring the affected links with the saved feature likelihoods (approximate)...')
+    write_relationships(infer_relationships(links, model, decisions, affected))
+    if save_state_dir:
+        delta.save_state(save_state_dir, key, links, paths, model, decisions)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Do problink inference.')
     parser.add_argument('-p', '--peeringdb',
@@ -100,16 +437,167 @@ if __name__ == '__main__':
     parser.add_argument('-a', '--as_org',
                         help='AS to organization mapping file',
                         required=True)
+    parser.add_argument('-w', '--workers',
+                        help='Number of processes for parsing BGP paths, building link attributes and scoring links',
+                        type=int, default=1)
+    parser.add_argument('-c', '--compact',
+                        help='Store BGP paths in a compact integer-encoded form',
+                        action='store_true')
+    parser.add_argument('--columnar',
+                        help='Keep per-link attributes in typed columns of a LinkTable to save memory',
+                        action='store_true')
+    parser.add_argument('-s', '--single_pass',
+                        help='Build path attributes in a single traversal of the BGP paths',
+                        action='store_true')
+    parser.add_argument('--check_single_pass',
+                        help='Check the single-pass engine against the per-attribute methods',
+                        action='store_true')
+    parser.add_argument('--loop_scoring',
+                        help='Score links one at a time instead of in a batch',
+                        action='store_true')
+    parser.add_argument('-i', '--max_iterations',
+                        help='Iterate inference until link types converge, for at most this many rounds',
+                        type=int, default=1)
+    parser.add_argument('-t', '--tolerance',
+                        help='Converged once at most this fraction of links changes type in a round',
+                        type=float, default=0.0)
+    parser.add_argument('--cache',
+                        help='Binary cache of sanitized paths and IXPs, reused while the inputs are unchanged')
+    parser.add_argument('--checkpoint_dir',
+                        help='Checkpoint the paths, link attributes and feature likelihoods to this directory')
+    parser.add_argument('--resume',
+                        help='Restart from the valid checkpoints in --checkpoint_dir, running only the missing stages',
+                        action='store_true')
+    parser.add_argument('--save_model',
+                        help='Save the class prior and feature likelihoods of this run as a model file')
+    parser.add_argument('--model',
+                        help='Score links with a saved model instead of computing feature likelihoods')
+    parser.add_argument('--save_state',
+                        help='Save the paths, attributes and decisions of this run to this directory for a later '
+                             '--delta_state run; implies --columnar')
+    parser.add_argument('--delta_state',
+                        help='Update the results of the run that saved this state instead of a full run')
+    parser.add_argument('--added',
+                        help='Sanitized paths added since the --delta_state run')
+    parser.add_argument('--withdrawn',
+                        help='Sanitized paths withdrawn since the --delta_state run')
+    parser.add_argument('--delta_approximate',
+                        help='Keep the feature likelihoods of the --delta_state run and re-score only the links on '
+                             'changed paths, which can differ from a full run',
+                        action='store_true')
+    parser.add_argument('--profile_report',
+                        help='Write wall time, CPU time, peak RSS growth and item counts of each stage to this JSON file')
+    parser.add_argument('--cprofile',
+                        help='Comma-separated stages to run under cProfile; stats are written to <stage>.prof '
+                             'next to --profile_report')
     args = parser.parse_args()
-    path = BgpPaths()
-    path.extract_ixp(args.peeringdb)
-    path.parse_bgp_paths('sanitized_rib.txt')
-    links = Links(path)
-    links.ingest_prob('asrank_result.txt')
-    links.construct_attributes(args.as_org, args.peeringdb)
-    print('Link attributes constructed...')
-    features = ProblinkFeatures(links)
-    features.compute_feature_likelihoods()
-    print('Feature likelihoods computed...')
-    naive_bayes(links, features)
+    if args.delta_state and (args.loop_scoring or args.max_iterations > 1):
+        parser.error('--delta_state does not support --loop_scoring or --max_iterations')
+    if args.save_state and (args.loop_scoring or args.max_iterations > 1):
+        parser.error('--save_state does not support --loop_scoring or --max_iterations')
+    if args.columnar and args.max_iterations > 1:
+        parser.error('--columnar does not support --max_iterations')
+    if args.delta_approximate and not args.delta_state:
+        parser.error('--delta_approximate needs --delta_state')
+    if args.model and (args.loop_scoring or args.delta_state or args.save_state or args.max_iterations > 1):
+        parser.error('--model does not support --loop_scoring, --delta_state, --save_state or --max_iterations')
+    if args.resume and not args.checkpoint_dir:
+        parser.error('--resume needs --checkpoint_dir')
+    if args.checkpoint_dir and args.delta_state:
+        parser.error('--checkpoint_dir does not support --delta_state')
+    if args.cprofile and not args.profile_report:
+        parser.error('--cprofile needs --profile_report')
+    profiler = None
+    if args.profile_report:
+        profiler = profiling.enable(args.cprofile.split(',') if args.cprofile else (),
+                                    os.path.dirname(os.path.abspath(args.profile_report)))
+    if args.delta_state or args.save_state:
+        state_key = delta.state_key('asrank_result.txt', args.peeringdb, args.as_org)
+    if args.delta_state:
+        with profiling.stage('delta_inference'):
+            delta_inference(args.delta_state, state_key, args.as_org, args.added, args.withdrawn, args.save_state,
+                            args.delta_approximate)
+    else:
+        checkpoints = path_checkpoints = None
+        if args.checkpoint_dir:
+            inputs = dict((f, fingerprint(f)) for f in ('sanitized_rib.txt', 'asrank_result.txt', args.peeringdb, args.as_org))
+            # paths only depend on the paths and PeeringDB files, everything else on all inputs
+            path_checkpoints = Checkpoints(args.checkpoint_dir, (inputs['sanitized_rib.txt'], inputs[args.peeringdb],
+                                                                 args.compact), args.resume)
+            # attributes are built differently, and pickled as dicts or columns, depending on the mode
+            checkpoints = Checkpoints(args.checkpoint_dir, (sorted(inputs.items()), args.compact, args.single_pass,
+                                                            args.columnar or bool(args.save_state)), args.resume)
+        with profiling.stage('paths') as counts:
+            peeringdb = PeeringDB(args.peeringdb)
+            path = path_checkpoints.load('paths') if path_checkpoints else None
+            if path is not None:
+                print('BGP paths restored from checkpoint...')
+            else:
+                path = BgpPaths(args.compact)
+                if args.cache:
+                    key = fingerprint('sanitized_rib.txt', args.peeringdb)
+                if not args.cache or not path.load_cache(args.cache, key):
+                    path.extract_ixp(peeringdb)
+                    path.parse_bgp_paths('sanitized_rib.txt', args.workers)
+                    if args.cache:
+                        path.save_cache(args.cache, key)
+                else:
+                    print('BGP paths loaded from %s...' % args.cache)
+                if path_checkpoints:
+                    path_checkpoints.save('paths', path)
+            counts.update(paths=len(path), ixps=len(path.ixp))
+        links = Links(path)
+        with profiling.stage('ingest_prob') as counts:
+            # not checkpointed: re-reading keeps links.prob, and so the output, in the same order
+            links.ingest_prob('asrank_result.txt', args.columnar or bool(args.save_state))
+            counts.update(links=len(links.prob))
+        if args.save_state and links.link_table is None:
+            parser.error('--save_state needs the links of the bootstrap file in a LinkTable')
+        with profiling.stage('construct_attributes') as counts:
+            links.construct_attributes(args.as_org, peeringdb, args.single_pass, args.workers, checkpoints)
+            counts.update(links=len(links.prob))
+        if args.check_single_pass:
+            mismatched = links.check_walk_paths()
+            if mismatched:
+                print('Single-pass engine differs on: ' + ', '.join(mismatched))
+            else:
+                print('Single-pass engine matches the per-attribute methods...')
+        print('Link attributes constructed...')
+        with profiling.stage('feature_likelihoods') as counts:
+            if args.model:
+                features = ProblinkModel.load(args.model)
+                print('Model loaded from %s...' % args.model)
+            else:
+                features = ProblinkFeatures(links)
+                tables = checkpoints.load('features') if checkpoints else None
+                if tables is not None:
+                    features.set_tables(tables)
+                    print('Feature likelihoods restored from checkpoint...')
+                else:
+                    features.compute_feature_likelihoods()
+                    print('Feature likelihoods computed...')
+                    if checkpoints:
+                        checkpoints.save('features', features.tables())
+                if args.save_model:
+                    ProblinkModel.from_features(compute_class_prior(links), features).save(args.save_model)
+            counts.update((name, len(getattr(features, name))) for name in FEATURE_TABLES)
+        with profiling.stage('inference') as counts:
+            if args.save_state:
+                links.count_path_attributes()
+                decisions = links.link_table.empty_column(np.int8)
+                write_relationships(infer_relationships(links, features, decisions))
+                paths = delta.SavedPaths.from_paths(path, delta.count_extra_lines('sanitized_rib.txt', path.ixp))
+                model = ProblinkModel.from_features(compute_class_prior(links), features)
+                delta.save_state(args.save_state, state_key, links, paths, model, decisions)
+            elif args.loop_scoring:
+                naive_bayes(links, features)
+            elif args.max_iterations > 1:
+                write_relationships(iterative_inference(links, features, args.max_iterations, args.tolerance))
+            elif args.workers > 1:
+                naive_bayes_sharded(links, features, args.workers)
+            else:
+                naive_bayes_batched(links, features)
+            counts.update(links=len(links.prob))
+    if profiler:
+        profiler.write(args.profile_report)
     print('Inference results are output to problink_result.txt')
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import resource
+import cProfile
+from contextlib import contextmanager
+
+# the profiler stages are recorded by; None while profiling is off
+_profiler = None
+
+
+class Profiler(object):
+    """Wall time, CPU time, peak RSS growth and item counts of named run stages.
+
+    Stages nest: each record names the stage it ran in. Stages listed in
+    cprofile_stages also run under cProfile, with stats written to
+    <profile_dir>/<stage>.prof for pstats or snakeviz.
+    """
+    def __init__(self, cprofile_stages=(), profile_dir='.'):
+        self.records = []
+        self.stack = []
+        self.cprofile_stages = set(cprofile_stages)
+        self.profile_dir = profile_dir
+        self.start_time = time.time()
+
+    def record(self, name):
+        """Add the record of a stage in the current one, without timing it."""
+        record = {'stage': name, 'parent': self.stack[-1]['stage'] if self.stack else None, 'counts': {}}
+        self.records.append(record)
+        return record
+
+    def start(self, name):
+        """Start timing a stage in the current one; the returned Stage is ended with stop()."""
+        return Stage(self, self.record(name))
+
+    @contextmanager
+    def stage(self, name):
+        stage = self.start(name)
+        self.stack.append(stage.record)
+        try:
+            yield stage.record['counts']
+        finally:
+            self.stack.pop()
+            stage.stop()
+
+    def report(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {'wall_s': time.time() - self.start_time,
+                'cpu_s': usage.ru_utime + usage.ru_stime,
+                'peak_rss_mb': usage.ru_maxrss / 1024.0,
+                'stages': self.records}
+
+    def write(self, report_file):
+        with open(report_file, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+
+class Stage(object):
+    """A running stage of a Profiler."""
+    def __init__(self, profiler, record):
+        self.profiler = profiler
+        self.record = record
+        self.profile = None
+        if record['stage'] in profiler.cprofile_stages:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        self.self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.wall = time.time()
+
+    def stop(self):
+        wall = time.time() - self.wall
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(os.path.join(self.profiler.profile_dir, self.record['stage'] + '.prof'))
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.record.update({
+            'wall_s': wall,
+            'cpu_s': (self_usage.ru_utime + self_usage.ru_stime) - (self.self_usage.ru_utime + self.self_usage.ru_stime),
+            # forked workers, counted once they have been joined
+            'children_cpu_s': (children_usage.ru_utime + children_usage.ru_stime) -
+                              (self.children_usage.ru_utime + self.children_usage.ru_stime),
+            # ru_maxrss is in KB on Linux
+            'peak_rss_mb': self_usage.ru_maxrss / 1024.0,
+            'peak_rss_delta_mb': (self_usage.ru_maxrss - self.self_usage.ru_maxrss) / 1024.0,
+        })
+
+
+class _NoStage(object):
+    def __init__(self):
+        self.record = {'counts': {}}
+
+    def stop(self):
+        pass
+
+
+def enable(cprofile_stages=(), profile_dir='.'):
+    """Start recording stages; returns the Profiler."""
+    global _profiler
+    _profiler = Profiler(cprofile_stages, profile_dir)
+    return _profiler
+
+
+def enabled():
+    return _profiler is not None
+
+
+def start(name):
+    """Start timing a stage that is not a block of code; end it with stop()."""
+    if _profiler is None:
+        return _NoStage()
+    return _profiler.start(name)
+
+
+def record(name):
+    """Add the record of a stage that is timed elsewhere, e.g. by start() in a forked
+    worker process, to be updated with the record of that Stage."""
+    if _profiler is None:
+        return {'counts': {}}
+    return _profiler.record(name)
+
+
+@contextmanager
+def stage(name):
+    """Time a block of code as a stage; does nothing while profiling is off.
+
+    Yields the stage's item counts, a dict that can be filled in.
+    """
+    if _profiler is None:
+        yield {}
+        return
+    with _profiler.stage(name) as counts:
+        yield counts
+
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+import os
+import json
+import random
+import argparse
+from collections import defaultdict
+from itertools import islice
+from bgp_path_parser import reserved_asn
+from problink import TIER1S
+
+
+class SyntheticTopology(object):
+    """Hierarchical AS topology to generate ProbLink inputs from.
+
+    A clique of Tier-1 ASes peering with each other, tiers of transit ASes
+    buying transit from the tier above (or from Tier-1s), and stub ASes buying
+    transit from transit ASes; ASes of the same tier peer, mostly at IXPs.
+    providers/customers/peers map an ASN (a string, as in BGP paths) to
+    lists of neighbors. The Tier-1s are the first n_tier1 ASes of
+    problink.TIER1S, whose links ProbLink takes as the Tier-1 clique; the
+    other ASes are numbered from 1 in tier order, skipping the Tier-1s and
+    the reserved ASNs that sanitize_path drops, and route servers get the
+    ASNs after the last stub.
+    """
+    def __init__(self, n_tier1=10, transit_tiers=(100, 500), n_stubs=5000, n_ixps=50, n_facilities=100,
+                 peers_per_as=3, sibling_fraction=0.02, seed=1):
+        self.rng = random.Random(seed)
+        if n_tier1 > len(TIER1S):
+            raise ValueError('at most %d Tier-1 ASes, the ones of problink.TIER1S.' % len(TIER1S))
+        self.tier1 = TIER1S[:n_tier1]
+        asns = (str(asn) for asn in xrange(1, 394240) if not reserved_asn(asn) and str(asn) not in TIER1S)
+        self.tiers = [self.tier1] + [_allocate(asns, n) for n in transit_tiers]
+        self.stubs = _allocate(asns, n_stubs)
+        self.route_servers = _allocate(asns, n_ixps)
+        self.providers = defaultdict(list)
+        self.customers = defaultdict(list)
+        self.peers = defaultdict(list)
+        self.ixp_members = [set([rs]) for rs in self.route_servers]
+        self.facility_members = [set() for _ in xrange(n_facilities)]
+        self.org = {}
+
+        for i, a in enumerate(self.tier1):
+            for b in self.tier1[i + 1:]:
+                self._add_peering(a, b)
+        for depth, tier in enumerate(self.tiers[1:], 1):
+            for a in tier:
+                # mostly the tier right above, sometimes straight from a Tier-1
+                for _ in xrange(self.rng.randint(1, 3)):
+                    above = self.tiers[depth - 1] if self.rng.random() < 0.8 else self.tier1
+                    self._add_transit(self.rng.choice(above), a)
+        transit = [a for tier in self.tiers[1:] for a in tier] or self.tier1
+        for a in self.stubs:
+            for _ in xrange(1 if self.rng.random() < 0.6 else self.rng.randint(2, 3)):
+                self._add_transit(self.rng.choice(transit), a)
+
+        # peering within transit tiers and among well-connected stubs, at IXPs
+        peering = transit + self.stubs[:len(self.stubs) // 10]
+        for a in peering:
+            for _ in xrange(self.rng.randint(0, peers_per_as)):
+                b = self.rng.choice(peering)
+                if b != a and b not in self.providers[a] and b not in self.customers[a]:
+                    self._add_peering(a, b)
+                    if self.ixp_members:
+                        self.ixp_members[self.rng.randrange(n_ixps)].update((a, b))
+        for a in self.tier1 + transit + self.stubs:
+            # facilities, more of them for ASes higher up the hierarchy
+            for _ in xrange(len(self.customers[a]) // 20 + self.rng.randint(0, 2) if self.facility_members else 0):
+                self.facility_members[self.rng.randrange(n_facilities)].add(a)
+            # sibling ASes share the organization of one of their providers
+            if self.providers[a] and self.rng.random() < sibling_fraction:
+                self.org[a] = self.org[self.rng.choice(self.providers[a])]
+            else:
+                self.org[a] = 'ORG-%s' % a
+
+    def _add_transit(self, provider, customer):
+        if provider != customer and provider not in self.providers[customer]:
+            self.providers[customer].append(provider)
+            self.customers[provider].append(customer)
+
+    def _add_peering(self, a, b):
+        if b not in self.peers[a]:
+            self.peers[a].append(b)
+            self.peers[b].append(a)
+
+    def ases(self):
+        return [a for tier in self.tiers for a in tier] + self.stubs
+
+    def relationships(self):
+        """Yield (AS1, AS2, rel) for every link: -1 for AS1 providing transit to AS2, 0 for peers."""
+        for provider in self.ases():
+            for customer in self.customers[provider]:
+                yield provider, customer, -1
+            for peer in self.peers[provider]:
+                if provider < peer:
+                    yield provider, peer, 0
+
+    def valley_free_path(self, vp):
+        """A random valley-free path from a vantage point: customer-to-provider
+        links up, at most one peering link, then provider-to-customer links down."""
+        path = [vp]
+        seen = set(path)
+        # climb until a Tier-1, or stop early at an AS that peers
+        while self.providers[path[-1]] and not (self.peers[path[-1]] and self.rng.random() < 0.3):
+            nxt = self.rng.choice(self.providers[path[-1]])
+            if nxt in seen:
+                break
+            path.append(nxt)
+            seen.add(nxt)
+        if self.peers[path[-1]] and self.rng.random() < 0.7:
+            nxt = self.rng.choice(self.peers[path[-1]])
+            if nxt not in seen:
+                path.append(nxt)
+                seen.add(nxt)
+        while self.customers[path[-1]] and self.rng.random() < 0.85:
+            nxt = self.rng.choice(self.customers[path[-1]])
+            if nxt in seen:
+                break
+            path.append(nxt)
+            seen.add(nxt)
+        return path
+
+    def write_rib(self, rib_file, n_paths, n_vps=None, prepend=0.1, route_server=0.05):
+        """Write n_paths valley-free paths, seen from n_vps vantage points, as a RIB
+        file, vantage point first as a collector sees them.
+
+        A fraction prepend of the paths has an AS prepended and a fraction
+        route_server has an IXP route server in it, for the parser to sanitize.
+        """
+        ases = self.ases()
+        vps = self.rng.sample(ases, min(n_vps or max(10, len(ases) // 50), len(ases)))
+        with open(rib_file, 'w') as f:
+            for _ in xrange(n_paths):
+                path = self.valley_free_path(self.rng.choice(vps))
+                if len(path) > 1 and self.rng.random() < prepend:
+                    i = self.rng.randrange(len(path))
+                    path.insert(i, path[i])
+                if len(path) > 1 and self.route_servers and self.rng.random() < route_server:
+                    path.insert(self.rng.randrange(1, len(path)), self.rng.choice(self.route_servers))
+                f.write('|'.join(path) + '\n')
+
+    def write_peeringdb(self, peeringdb_file):
+        """Write a PeeringDB json dump with the route servers, IXP and facility memberships."""
+        networks = [{'asn': int(a), 'info_type': 'Route Server'} for a in self.route_servers]
+        networks.extend({'asn': int(a), 'info_type': 'NSP' if self.customers[a] else 'Cable/DSL/ISP'}
+                        for a in self.ases())
+        netixlan = [{'asn': int(a), 'ixlan_id': ixp}
+                    for ixp, members in enumerate(self.ixp_members) for a in sorted(members)]
+        netfac = [{'local_asn': int(a), 'fac_id': facility}
+                  for facility, members in enumerate(self.facility_members) for a in sorted(members)]
+        with open(peeringdb_file, 'w') as f:
+            json.dump({'net': {'data': networks}, 'netixlan': {'data': netixlan}, 'netfac': {'data': netfac}}, f)
+
+    def write_as_org(self, as_org_file):
+        """Write a CAIDA AS to organization mapping file."""
+        with open(as_org_file, 'w') as f:
+            f.write('# format:org_id|changed|name|country|source\n')
+            for org in sorted(set(self.org.itervalues())):
+                f.write('%s|20190101|%s|US|ARIN\n' % (org, org))
+            f.write('# format:aut|changed|aut_name|org_id|opaque_id|source\n')
+            for a in self.ases():
+                f.write('%s|20190101|AS%s|%s||ARIN\n' % (a, a, self.org[a]))
+
+    def write_bootstrap(self, bootstrap_file, error_rate=0.03):
+        """Write an AS-Rank-style bootstrap file of the relationships, with a fraction
+        error_rate of them inferred wrongly: peers as transit and the other way round."""
+        with open(bootstrap_file, 'w') as f:
+            f.write('# synthetic AS-Rank bootstrap\n')
+            for AS1, AS2, rel in self.relationships():
+                if self.rng.random() < error_rate:
+                    rel = 0 if rel == -1 else -1
+                f.write('%s|%s|%d\n' % (AS1, AS2, rel))
+
+
+def _allocate(asns, n):
+    """The next n ASNs of an iterator."""
+    ases = list(islice(asns, n))
+    if len(ases) < n:
+        raise ValueError('the topology needs more ASNs than sanitize_path keeps.')
+    return ases
+
+
+def topology_for_paths(n_paths, seed=1):
+    """A topology sized for about n_paths paths, from 10k paths on a few thousand
+    ASes up to an Internet-sized one (~70k ASes) for 10M paths."""
+    n_stubs = max(2000, min(60000, n_paths // 150))
+    return SyntheticTopology(n_tier1=15, transit_tiers=(n_stubs // 50, n_stubs // 10), n_stubs=n_stubs,
+                             n_ixps=max(20, n_stubs // 200), n_facilities=max(50, n_stubs // 100), seed=seed)
+
+
+def generate(directory, n_paths, seed=1):
+    """Write rib.txt, peeringdb.json, as-org.txt and asrank_result.txt for n_paths paths to directory."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    topology = topology_for_paths(n_paths, seed)
+    topology.write_rib(os.path.join(directory, 'rib.txt'), n_paths)
+    topology.write_peeringdb(os.path.join(directory, 'peeringdb.json'))
+    topology.write_as_org(os.path.join(directory, 'as-org.txt'))
+    topology.write_bootstrap(os.path.join(directory, 'asrank_result.txt'))
+    return topology
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate ProbLink inputs from a synthetic AS topology')
+    parser.add_argument('-n', '--paths',
+                        help='Number of BGP paths',
+                        type=int, default=100000)
+    parser.add_argument('-o', '--output_dir',
+                        help='Directory to write rib.txt, peeringdb.json, as-org.txt and asrank_result.txt to',
+                        default='.')
+    parser.add_argument('--seed',
+                        help='Random seed',
+                        type=int, default=1)
+    args = parser.parse_args()
+    generate(args.output_dir, args.paths, args.seed)